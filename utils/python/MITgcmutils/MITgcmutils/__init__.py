@@ -1,5 +1,5 @@
 from numpy import nan, inf
-from .mds import rdmds, wrmds
+from .mds import rdmds, wrmds, open_mds, iter_mds
 from .ptracers import iolabel,iolabel2num
 from .diagnostics import readstats
 from .mnc import rdmnc, mnc_files
@@ -11,6 +11,6 @@ from . import examples
 from . import density as dens
 from . import mds
 
-__all__ = ['nan', 'inf', 'rdmds', 'wrmds', 'iolabel', 'iolabel2num',
+__all__ = ['nan', 'inf', 'rdmds', 'wrmds', 'open_mds', 'iter_mds', 'iolabel', 'iolabel2num',
            'readstats', 'rdmnc', 'mnc_files','gen_blanklist', 'hfac',
            'readbin','tilecmap','writebin','pfromz','cs','llc','dens']
@@ -0,0 +1,41 @@
+"""A small thread-safe LRU cache shared by mds, mnc and netcdf."""
+import threading
+from collections import OrderedDict
+
+
+class _LRUCache(object):
+    """ a thread-safe dictionary that forgets the least recently used items """
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            try:
+                val = self._data.pop(key)
+            except KeyError:
+                self.misses += 1
+                return None
+            self._data[key] = val
+            self.hits += 1
+            return val
+
+    def set(self, key, val):
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = val
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def info(self):
+        return dict(hits=self.hits, misses=self.misses,
+                    size=len(self._data), maxsize=self.maxsize)
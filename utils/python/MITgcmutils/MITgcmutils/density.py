@@ -11,6 +11,19 @@ Density of Sea Water using the Jackett and McDougall 1995 (JAOT 12) polynomial
 Density of Sea Water using the UNESCO equation of state formula (IES80)
 of Fofonoff and Millard (1983) [FRM83].
 Density of Sea Water using the EOS-10 48-term polynomial.
+
+All functions accept dtype=np.float32 to compute in single precision,
+which is about twice as fast and needs half the memory.  Compared to the
+computation in double precision (of the same float32 input), the error of
+the density is below 3e-4 kg/m^3 for jmd95 and unesco, 5e-4 kg/m^3 for
+mdjwf and 1e-3 kg/m^3 for teos10 (relative errors below 1e-6) for
+0 <= salt <= 42, -2 <= theta <= 40 and 0 <= p <= 10000 dbar (measured
+maxima are about 1.9e-4, 1.9e-4, 3.7e-4 and 8.5e-4 kg/m^3; the script
+benchmarks/bench_density.py checks these bounds).  Density differences
+have errors of the same size, which is not small for N^2: typical density
+differences between adjacent levels are 1e-3 to 1e-2 kg/m^3, so N^2
+computed in float32 can be off by 10% or more.  Compute N^2 in double
+precision.
 """
 
 # coefficients nonlinear equation of state in pressure coordinates for
@@ -33,38 +46,224 @@ eosJMDCSw = [   8.244930e-01,
               - 1.654600e-06,
                 4.831400e-04,
             ]
+# 3. secant bulk modulus K of fresh water at p = 0, jmd95
+eosJMDCKFw = [   1.965933e+04,
+                 1.444304e+02,
+               - 1.706103e+00,
+                 9.648704e-03,
+               - 4.190253e-05
+             ]
+# 4. secant bulk modulus K of sea water at p = 0, jmd95
+eosJMDCKSw = [  5.284855e+01,
+              - 3.101089e-01,
+                6.283263e-03,
+              - 5.084188e-05,
+                3.886640e-01,
+                9.085835e-03,
+              - 4.619924e-04
+             ]
+# 5. secant bulk modulus K of sea water at p, jmd95
+eosJMDCKP = [    3.186519e+00,
+                2.212276e-02,
+              - 2.984642e-04,
+                1.956415e-06,
+                6.704388e-03,
+              - 1.847318e-04,
+                2.059331e-07,
+                1.480266e-04,
+                2.102898e-04,
+              - 1.202016e-05,
+                1.394680e-07,
+              - 2.040237e-06,
+                6.128773e-08,
+                6.207323e-10
+            ]
+# 3. - 5. the same for unesco
+eosUNESCOKFw = [   1.965221e+04,
+                   1.484206e+02,
+                 - 2.327105e+00,
+                   1.360477e-02,
+                 - 5.155288e-05
+               ]
+eosUNESCOKSw = [   5.467460e+01,
+                 - 0.603459e+00,
+                   1.099870e-02,
+                 - 6.167000e-05,
+                   7.944000e-02,
+                   1.648300e-02,
+                 - 5.300900e-04
+               ]
+eosUNESCOKP = [   3.239908e+00,
+                  1.437130e-03,
+                  1.160920e-04,
+                - 5.779050e-07,
+                  2.283800e-03,
+                - 1.098100e-05,
+                - 1.607800e-06,
+                  1.910750e-04,
+                  8.509350e-05,
+               -  6.122930e-06,
+                  5.278700e-08,
+               -  9.934800e-07,
+                  2.081600e-08,
+                  9.169700e-10
+              ]
+# 6. mdjwf, numerator and denominator
+eosMDJWFnum = [   7.35212840e+00,
+                - 5.45928211e-02,
+                  3.98476704e-04,
+                  2.96938239e+00,
+                - 7.23268813e-03,
+                  2.12382341e-03,
+                  1.04004591e-02,
+                  1.03970529e-07,
+                  5.18761880e-06,
+                - 3.24041825e-08,
+                - 1.23869360e-11,
+                  9.99843699e+02
+              ]
+eosMDJWFden = [   7.28606739e-03,
+                - 4.60835542e-05,
+                  3.68390573e-07,
+                  1.80809186e-10,
+                  2.14691708e-03,
+                - 9.27062484e-06,
+                - 1.78343643e-10,
+                  4.76534122e-06,
+                  1.63410736e-09,
+                  5.30848875e-06,
+                - 3.03175128e-16,
+                - 1.27934137e-17,
+                  1.00000000e+00
+              ]
+# 7. teos10, 48-term polynomial
+eosTEOS10 = [   9.998420897506056e+02,
+                2.839940833161907e00,
+              - 3.147759265588511e-02,
+                1.181805545074306e-03,
+              - 6.698001071123802e00,
+              - 2.986498947203215e-02,
+                2.327859407479162e-04,
+              - 3.988822378968490e-02,
+                5.095422573880500e-04,
+              - 1.426984671633621e-05,
+                1.645039373682922e-07,
+              - 2.233269627352527e-02,
+              - 3.436090079851880e-04,
+                3.726050720345733e-06,
+              - 1.806789763745328e-04,
+                6.876837219536232e-07,
+              - 3.087032500374211e-07,
+              - 1.988366587925593e-08,
+              - 1.061519070296458e-11,
+                1.550932729220080e-10,
+                1.000000000000000e00,
+                2.775927747785646e-03,
+              - 2.349607444135925e-05,
+                1.119513357486743e-06,
+                6.743689325042773e-10,
+              - 7.521448093615448e-03,
+              - 2.764306979894411e-05,
+                1.262937315098546e-07,
+                9.527875081696435e-10,
+              - 1.811147201949891e-11,
+              - 3.303308871386421e-05,
+                3.801564588876298e-07,
+              - 7.672876869259043e-09,
+              - 4.634182341116144e-11,
+                2.681097235569143e-12,
+                5.419326551148740e-06,
+              - 2.742185394906099e-05,
+              - 3.212746477974189e-07,
+                3.191413910561627e-09,
+              - 1.931012931541776e-12,
+              - 1.105097577149576e-07,
+                6.211426728363857e-10,
+              - 1.119011592875110e-10,
+              - 1.941660213148725e-11,
+              - 1.864826425365600e-14,
+                1.119522344879478e-14,
+              - 1.200507748551599e-15,
+                6.057902487546866e-17,
+            ]
+
+# number of elements evaluated at a time by the equation of state kernels;
+# temporaries of this size stay in cache and are reused by malloc
+_blocksize = 8192
 
 def _check_salinity(s):
 
     sneg = s<0
-    if not np.any(sneg):
+    if np.any(sneg):
         warnings.warn('found negative salinity values, reset them to NaN')
         # s[sneg] = np.NaN
 
     return s
 
-def _check_dimensions(s,t,p=np.zeros(())):
+def _horner(x, coeffs, out=None):
+    """ out = c[0] + x*(c[1] + x*(c[2] + ...)), in place """
+    if out is None:
+        out = np.empty_like(x)
+    out[...] = coeffs[-1]
+    for c in coeffs[-2::-1]:
+        out *= x
+        out += c
+    return out
+
+def _dhorner(x, coeffs, out=None):
+    """ derivative of _horner(x, coeffs) with respect to x """
+    return _horner(x, [ i*c for i,c in enumerate(coeffs) ][1:], out)
+
+def _evaluate(kernel, args, out=None, dtype=np.float64, nout=1, **kwargs):
     """
-    Check compatibility of dimensions of input variables and
+    Evaluate kernel(*args, *outs, **kwargs) block by block.
 
-    Parameters
-    ----------
-    salt : array_like
-        salinity [psu (PSS-78)]
-    theta : array_like
-        potential temperature [degree C (IPTS-68)]
-        same shape as salt
-    p  : pressure [dBar]
+    The arguments are broadcast against each other and converted to
+    dtype in blocks of _blocksize elements, so the kernel only creates
+    temporaries of block size.  The result is stored in out, or in a new
+    array (a scalar for scalar arguments).  With nout > 1, out is a tuple
+    of nout arrays (or None) and a tuple is returned.
     """
-
-    if s.shape != t.shape or s.shape != p.shape:
-        print('trying to broadcast shapes')
-        np.broadcast(s,t,p)
-
-    return
+    # nditer checks that the shapes broadcast
+    args = [ np.asarray(a) for a in args ]
+    if nout == 1:
+        outs = [out]
+    elif out is None:
+        outs = nout*[None]
+    else:
+        outs = list(out)
+
+    it = np.nditer(args + outs,
+                   flags=['external_loop', 'buffered', 'zerosize_ok'],
+                   op_flags=[['readonly']]*len(args)
+                            + [['writeonly', 'allocate', 'no_broadcast']]*nout,
+                   op_dtypes=[dtype]*(len(args) + nout),
+                   casting='same_kind', buffersize=_blocksize)
+    with it:
+        for chunk in it:
+            _check_salinity(chunk[0])
+            kernel(*chunk, **kwargs)
+        res = it.operands[len(args):]
+
+    res = [ r[()] if o is None and r.ndim == 0 else r
+            for r,o in zip(res, outs) ]
+
+    if nout == 1:
+        return res[0]
+    else:
+        return tuple(res)
+
+def _linear(s, t, rho, sref, tref, sbeta, talpha, rhonil):
+    np.subtract(s, sref, out=rho)
+    rho *= sbeta
+    rho -= talpha*(t-tref)
+    rho *= rhonil
+    rho += rhonil
+    return rho
 
 def linear(salt,theta,
-           sref=30,tref=20,sbeta=7.4e-04,talpha=2.0e-04,rhonil=9.998e+02):
+           sref=30,tref=20,sbeta=7.4e-04,talpha=2.0e-04,rhonil=9.998e+02,
+           out=None,dtype=np.float64):
     """
     Computes in-situ density of water
 
@@ -87,6 +286,10 @@ def linear(salt,theta,
               default 2.0e-04 [(g/Kg)-1]
     rhonil    : density of water
               default 999.8 [(g/Kg)-1];
+    out : ndarray, optional
+        array of the broadcast shape of the inputs to store the result in
+    dtype : data type
+        floating point type of the computation (default float64)
 
     Returns
     -------
@@ -104,19 +307,33 @@ def linear(salt,theta,
     - Converted to python by Gavilan on 2024-07-18
     """
 
-    # make sure arguments are floating point
-    s = np.asfarray(salt)
-    t = np.asfarray(theta)
-
-    _check_dimensions(s,t)
-
-    s = _check_salinity(s)
-
-    rho = rhonil*(sbeta *(s-sref)-talpha*(t-tref))+rhonil
-
+    return _evaluate(_linear, (salt, theta), out, dtype, sref=sref, tref=tref,
+                     sbeta=sbeta, talpha=talpha, rhonil=rhonil)
+
+def _poly3(s, t, tref, sref, dref, c0, c1, c2, c3, c4, c5, c6, c7, c8, rho):
+    """ rho = dref + deltaSig(t - tref, s - sref), deltaSig in Horner form """
+    tp = t - tref
+    sp = s - sref
+    # c1*sp + c4*sp^2 + c7*tp*sp^2 + c8*sp^3
+    a = c8*sp
+    a += c7*tp
+    a += c4
+    a *= sp
+    a += c1
+    a *= sp
+    # c0*tp + c2*tp^2 + c3*tp*sp + c5*tp^3 + c6*tp^2*sp
+    np.multiply(c5, tp, out=rho)
+    rho += c6*sp
+    rho += c2
+    rho *= tp
+    rho += c3*sp
+    rho += c0
+    rho *= tp
+    rho += a
+    rho += dref
     return rho
 
-def poly3(poly3,salt,theta):
+def poly3(poly3,salt,theta,zaxis=0,out=None,dtype=np.float64):
     """
     Calculates in-situ density as approximated by the POLY3 method
     based on the Knudsen formula (see Bryan and Cox 1972).
@@ -124,12 +341,20 @@ def poly3(poly3,salt,theta):
     Parameters
     ----------
     poly3 : coefficients read from file
-            'POLY3.COEFFS' using INI_POLY3
+            'POLY3.COEFFS' using INI_POLY3, shape (Nr, 12),
+            or the coefficients of a single level, shape (12,)
     salt : array_like
            salinity [psu (PSS-78)]
     theta : array_like
             potential temperature [degree C (IPTS-68)];
             same shape as salt
+    zaxis : int
+            axis of salt and theta along the Nr levels (default 0);
+            use, e.g., zaxis=-3 for (..., Nr, ny, nx) time series
+    out : ndarray, optional
+            array of the broadcast shape of the inputs to store the result in
+    dtype : data type
+            floating point type of the computation (default float64)
 
     Returns
     -------
@@ -144,52 +369,32 @@ def poly3(poly3,salt,theta):
     >>> D=poly3(p,salt,theta)
     >>> or to work within a single model level
     >>> D=poly3(P[3,:],S[3,:,:],T[3,:,:])
+    >>> or for all levels of several time steps
+    >>> T=rdmds('T',np.nan)
+    >>> S=rdmds('S',np.nan)
+    >>> D=poly3(p,S,T,zaxis=1)
 
 
     Notes
     -----
     - Source code written by Martin Losch 2002-08-09
     - Converted to python by Gavilan on 2024-07-18
+    - All levels are evaluated at once, with the coefficients broadcast
+      along zaxis
     """
-    # make sure arguments are floating point
-    s = np.asfarray(salt)
-    t = np.asfarray(theta)
-    coeffs=poly3[:,3:]
-
-
-    _check_dimensions(s,t)
-
-    s = _check_salinity(s)
-
-    Nr=poly3.shape[0]
+    poly3 = np.asarray(poly3)
+    coeffs = [ poly3[...,i] for i in range(12) ]
+    coeffs[2] = coeffs[2] + 1000
+    if poly3.ndim == 2:
+        shape = np.broadcast_shapes(np.shape(salt), np.shape(theta))
+        ndim = len(shape)
+        if not -ndim <= zaxis < ndim or shape[zaxis] != poly3.shape[0]:
+            raise ValueError('salt and theta need {} levels along axis {}'
+                             .format(poly3.shape[0], zaxis))
+        zshape = (poly3.shape[0],) + (ndim - zaxis%ndim - 1)*(1,)
+        coeffs = [ c.reshape(zshape) for c in coeffs ]
 
-    t=np.reshape(t,[Nr,np.prod(np.shape(t))//Nr])
-    s=np.reshape(s,[Nr,np.prod(np.shape(s))//Nr])
-    rho=np.zeros([Nr,np.prod(np.shape(s))//Nr])
-    for k in range(0,Nr):
-        tRef=poly3[k,0]
-        sRef=poly3[k,1]
-        dRef=poly3[k,2]+1000
-        tp=t[k,:]-tRef;
-        sp=s[k,:]-sRef;
-
-        tp2=tp*tp
-        sp2=sp*sp
-
-        deltaSig = (   coeffs[k,0]*tp
-                     + coeffs[k,1]*sp
-                     + coeffs[k,2]*tp2
-                     + coeffs[k,3]*tp*sp
-                     + coeffs[k,4]*sp2
-                     + coeffs[k,5]*tp2*tp
-                     + coeffs[k,6]*tp2*sp
-                     + coeffs[k,7]*tp*sp2
-                     + coeffs[k,8]*sp2*sp
-                    )
-
-        rho[k,:]=deltaSig+dRef
-
-    return np.reshape(rho,s.shape)
+    return _evaluate(_poly3, [salt, theta] + coeffs, out, dtype)
 
 
 def ini_poly3(fpath='POLY3.COEFFS'):
@@ -212,7 +417,54 @@ def ini_poly3(fpath='POLY3.COEFFS'):
 
     return poly
 
-def jmd95(salt,theta,p):
+def _rhosurf(s, t, sqrts, rho):
+    """ density of sea water at p = 0 (jmd95 and unesco) """
+    a = _horner(t, eosJMDCSw[5:8])
+    a *= sqrts
+    a += _horner(t, eosJMDCSw[:5])
+    a += eosJMDCSw[8]*s
+    a *= s
+    _horner(t, eosJMDCFw, rho)
+    rho += a
+    return rho
+
+def _bulkmod(s, t, sqrts, p, kfw, ksw, kp, bulkmod):
+    """ secant bulk modulus with coefficients kfw, ksw, kp, p in bar """
+    # fresh water at the surface
+    _horner(t, kfw, bulkmod)
+    # sea water at the surface
+    a = _horner(t, ksw[4:7])
+    a *= sqrts
+    a += _horner(t, ksw[:4])
+    a *= s
+    bulkmod += a
+    # sea water at pressure p
+    b = _horner(t, kp[11:14])
+    b *= s
+    b += _horner(t, kp[8:11])
+    b *= p
+    _horner(t, kp[4:7], a)
+    a += kp[7]*sqrts
+    a *= s
+    a += b
+    a += _horner(t, kp[:4])
+    a *= p
+    bulkmod += a
+    return bulkmod
+
+def _secant(s, t, p, rho, kfw, ksw, kp):
+    """ rho = rho(s,t,0)/(1 - p/K(s,t,p)), p in dbar """
+    sqrts = np.sqrt(s)
+    # convert pressure to bar
+    p = .1*p
+    _rhosurf(s, t, sqrts, rho)
+    bulkmod = _bulkmod(s, t, sqrts, p, kfw, ksw, kp, np.empty_like(t))
+    np.divide(p, bulkmod, out=bulkmod)
+    np.subtract(1., bulkmod, out=bulkmod)
+    rho /= bulkmod
+    return rho
+
+def jmd95(salt,theta,p,out=None,dtype=np.float64):
     """
     Computes in-situ density of sea water
 
@@ -229,6 +481,10 @@ def jmd95(salt,theta,p):
     p : array_like
         sea pressure [dbar]. p may have dims 1x1,
         mx1, 1xn or mxn for s(mxn)
+    out : ndarray, optional
+        array of the broadcast shape of the inputs to store the result in
+    dtype : data type
+        floating point type of the computation (default float64)
 
     Returns
     -------
@@ -246,150 +502,23 @@ def jmd95(salt,theta,p):
     - Jackett and McDougall, 1995, JAOT 12(4), pp. 381-388
     - Source code written by Martin Losch 2002-08-09
     - Converted to python by jahn on 2010-04-29
+    - The polynomials are evaluated in Horner form, in blocks of
+      _blocksize elements, so no full-size temporaries are created.
     """
+    return _evaluate(_secant, (salt, theta, p), out, dtype,
+                     kfw=eosJMDCKFw, ksw=eosJMDCKSw, kp=eosJMDCKP)
 
-    # make sure arguments are floating point
-    s = np.asfarray(salt)
-    t = np.asfarray(theta)
-    p = np.asfarray(p)
 
-    _check_dimensions(s,t,p)
+def _bulkmodkernel(s, t, p, bulkmod, kfw, ksw, kp):
+    return _bulkmod(s, t, np.sqrt(s), p, kfw, ksw, kp, bulkmod)
 
-    s = _check_salinity(s)
-
-    # convert pressure to bar
-    p = .1*p
-    t2 = t*t
-    t3 = t2*t
-    t4 = t3*t
-
-    s3o2 = s*np.sqrt(s)
-
-    # density of freshwater at the surface
-    rho = ( eosJMDCFw[0]
-          + eosJMDCFw[1]*t
-          + eosJMDCFw[2]*t2
-          + eosJMDCFw[3]*t3
-          + eosJMDCFw[4]*t4
-          + eosJMDCFw[5]*t4*t
-          )
-    # density of sea water at the surface
-    rho = ( rho
-           + s*(
-                 eosJMDCSw[0]
-               + eosJMDCSw[1]*t
-               + eosJMDCSw[2]*t2
-               + eosJMDCSw[3]*t3
-               + eosJMDCSw[4]*t4
-               )
-           + s3o2*(
-                 eosJMDCSw[5]
-               + eosJMDCSw[6]*t
-               + eosJMDCSw[7]*t2
-               )
-           + eosJMDCSw[8]*s*s
-          )
-
-    rho = rho / (1. - p/bulkmodjmd95(s,t,p))
-
-    return rho
-
-
-def bulkmodjmd95(salt,theta,p):
-    """ Compute bulk modulus
+def bulkmodjmd95(salt,theta,p,out=None,dtype=np.float64):
+    """ Compute bulk modulus, p in bar
     """
-    # make sure arguments are floating point
-    s = np.asfarray(salt)
-    t = np.asfarray(theta)
-    p = np.asfarray(p)
-
-    # coefficients in pressure coordinates for
-    # 3. secant bulk modulus K of fresh water at p = 0
-    eosJMDCKFw = [   1.965933e+04,
-                     1.444304e+02,
-                   - 1.706103e+00,
-                     9.648704e-03,
-                   - 4.190253e-05
-                 ]
-    # 4. secant bulk modulus K of sea water at p = 0
-    eosJMDCKSw = [  5.284855e+01,
-                  - 3.101089e-01,
-                    6.283263e-03,
-                  - 5.084188e-05,
-                    3.886640e-01,
-                    9.085835e-03,
-                  - 4.619924e-04
-                 ]
-    # 5. secant bulk modulus K of sea water at p
-    eosJMDCKP = [    3.186519e+00,
-                    2.212276e-02,
-                  - 2.984642e-04,
-                    1.956415e-06,
-                    6.704388e-03,
-                  - 1.847318e-04,
-                    2.059331e-07,
-                    1.480266e-04,
-                    2.102898e-04,
-                  - 1.202016e-05,
-                    1.394680e-07,
-                  - 2.040237e-06,
-                    6.128773e-08,
-                    6.207323e-10
-                ]
-
-    _check_dimensions(s,t,p)
-
-    t2 = t*t
-    t3 = t2*t
-    t4 = t3*t
-    s3o2 = s*np.sqrt(s)
-
-    #p = pressure(i,j,k,bi,bj)*SItoBar
-    p2 = p*p
-    # secant bulk modulus of fresh water at the surface
-    bulkmod = ( eosJMDCKFw[0]
-              + eosJMDCKFw[1]*t
-              + eosJMDCKFw[2]*t2
-              + eosJMDCKFw[3]*t3
-              + eosJMDCKFw[4]*t4
-              )
-    # secant bulk modulus of sea water at the surface
-    bulkmod = ( bulkmod
-              + s*(      eosJMDCKSw[0]
-                       + eosJMDCKSw[1]*t
-                       + eosJMDCKSw[2]*t2
-                       + eosJMDCKSw[3]*t3
-                       )
-              + s3o2*(   eosJMDCKSw[4]
-                       + eosJMDCKSw[5]*t
-                       + eosJMDCKSw[6]*t2
-                       )
-               )
-    # secant bulk modulus of sea water at pressure p
-    bulkmod = ( bulkmod
-              + p*(   eosJMDCKP[0]
-                    + eosJMDCKP[1]*t
-                    + eosJMDCKP[2]*t2
-                    + eosJMDCKP[3]*t3
-                  )
-              + p*s*(   eosJMDCKP[4]
-                      + eosJMDCKP[5]*t
-                      + eosJMDCKP[6]*t2
-                    )
-              + p*s3o2*eosJMDCKP[7]
-              + p2*(   eosJMDCKP[8]
-                     + eosJMDCKP[9]*t
-                     + eosJMDCKP[10]*t2
-                   )
-              + p2*s*(  eosJMDCKP[11]
-                      + eosJMDCKP[12]*t
-                      + eosJMDCKP[13]*t2
-                     )
-               )
-
-    return bulkmod
+    return _evaluate(_bulkmodkernel, (salt, theta, p), out, dtype,
+                     kfw=eosJMDCKFw, ksw=eosJMDCKSw, kp=eosJMDCKP)
 
-def unesco(salt,theta,p):
+def unesco(salt,theta,p,out=None,dtype=np.float64):
     """
     Computes in-situ density of sea water
 
@@ -406,6 +535,10 @@ def unesco(salt,theta,p):
     p : array_like
         sea pressure [dbar]. p may have dims 1x1,
         mx1, 1xn or mxn for s(mxn)
+    out : ndarray, optional
+        array of the broadcast shape of the inputs to store the result in
+    dtype : data type
+        floating point type of the computation (default float64)
 
     Returns
     -------
@@ -422,150 +555,55 @@ def unesco(salt,theta,p):
     - Source code written by Martin Losch 2002-08-09
     - Converted to python by Gavilan on 2024-07-18
     """
+    return _evaluate(_secant, (salt, theta, p), out, dtype,
+                     kfw=eosUNESCOKFw, ksw=eosUNESCOKSw, kp=eosUNESCOKP)
 
-    # make sure arguments are floating point
-    s = np.asfarray(salt)
-    t = np.asfarray(theta)
-    p = np.asfarray(p)
 
-    _check_dimensions(s,t,p)
-
-    s = _check_salinity(s)
-
-    # convert pressure to bar
-    p = .1*p
-    t2 = t*t
-    t3 = t2*t
-    t4 = t3*t
-    s3o2 = s*np.sqrt(s)
-
-    # density of freshwater at the surface
-    rho = ( eosJMDCFw[0]
-          + eosJMDCFw[1]*t
-          + eosJMDCFw[2]*t2
-          + eosJMDCFw[3]*t3
-          + eosJMDCFw[4]*t4
-          + eosJMDCFw[5]*t4*t
-          )
-    # density of sea water at the surface
-    rho = ( rho
-           + s*(
-                 eosJMDCSw[0]
-               + eosJMDCSw[1]*t
-               + eosJMDCSw[2]*t2
-               + eosJMDCSw[3]*t3
-               + eosJMDCSw[4]*t4
-               )
-           + s3o2*(
-                 eosJMDCSw[5]
-               + eosJMDCSw[6]*t
-               + eosJMDCSw[7]*t2
-               )
-           + eosJMDCSw[8]*s*s
-          )
-
-    rho = rho / (1. - p/bulkmodunesco(s,t,p))
-
-    return rho
-
-
-def bulkmodunesco(salt,theta,p):
-    """ Compute bulk modulus
+def bulkmodunesco(salt,theta,p,out=None,dtype=np.float64):
+    """ Compute bulk modulus, p in bar
     """
-    # make sure arguments are floating point
-    s = np.asfarray(salt)
-    t = np.asfarray(theta)
-    p = np.asfarray(p)
-
-    # 3. secant bulk modulus K of fresh water at p = 0
-    eosJMDCKFw = [   1.965221e+04,
-                     1.484206e+02,
-                   - 2.327105e+00,
-                     1.360477e-02,
-                   - 5.155288e-05
-         ]
-    # 4. secant bulk modulus K of sea water at p = 0
-    eosJMDCKSw = [   5.467460e+01,
-                   - 0.603459e+00,
-                     1.099870e-02,
-                   - 6.167000e-05,
-                     7.944000e-02,
-                     1.648300e-02,
-                   - 5.300900e-04
-             ]
-    # 5. secant bulk modulus K of sea water at p
-    eosJMDCKP = [   3.239908e+00,
-                    1.437130e-03,
-                    1.160920e-04,
-                  - 5.779050e-07,
-                    2.283800e-03,
-                  - 1.098100e-05,
-                  - 1.607800e-06,
-                    1.910750e-04,
-                    8.509350e-05,
-                 -  6.122930e-06,
-                    5.278700e-08,
-                 -  9.934800e-07,
-                    2.081600e-08,
-                    9.169700e-10
-                ]
-
-    _check_dimensions(s,t,p)
+    return _evaluate(_bulkmodkernel, (salt, theta, p), out, dtype,
+                     kfw=eosUNESCOKFw, ksw=eosUNESCOKSw, kp=eosUNESCOKP)
 
+def _mdjwf(s, t, p, rho, epsln=0):
+    """ rho = num/(epsln + den), both in Horner form """
     t2 = t*t
-    t3 = t2*t
-    t4 = t3*t
-
-    sneg = np.where(s < 0 )
-
-    s3o2 = s*np.sqrt(s)
-
-    #p = pressure(i,j,k,bi,bj)*SItoBar
-    p2 = p*p
-    # secant bulk modulus of fresh water at the surface
-    bulkmod = ( eosJMDCKFw[0]
-              + eosJMDCKFw[1]*t
-              + eosJMDCKFw[2]*t2
-              + eosJMDCKFw[3]*t3
-              + eosJMDCKFw[4]*t4
-              )
-    # secant bulk modulus of sea water at the surface
-    bulkmod = ( bulkmod
-              + s*(      eosJMDCKSw[0]
-                       + eosJMDCKSw[1]*t
-                       + eosJMDCKSw[2]*t2
-                       + eosJMDCKSw[3]*t3
-                       )
-              + s3o2*(     eosJMDCKSw[4]
-                       + eosJMDCKSw[5]*t
-                       + eosJMDCKSw[6]*t2
-                       )
-               )
-    # secant bulk modulus of sea water at pressure p
-    bulkmod = ( bulkmod
-              + p*(      eosJMDCKP[0]
-                    + eosJMDCKP[1]*t
-                    + eosJMDCKP[2]*t2
-                    + eosJMDCKP[3]*t3
-                  )
-              + p*s*(    eosJMDCKP[4]
-                      + eosJMDCKP[5]*t
-                      + eosJMDCKP[6]*t2
-                    )
-              + p*s3o2*eosJMDCKP[7]
-              + p2*(   eosJMDCKP[8]
-                     + eosJMDCKP[9]*t
-                     + eosJMDCKP[10]*t2
-                   )
-              + p2*s*(    eosJMDCKP[11]
-                      + eosJMDCKP[12]*t
-                      + eosJMDCKP[13]*t2
-                     )
-               )
-
-    return bulkmod
+    # numerator, into rho
+    _horner(t, [eosMDJWFnum[11]] + eosMDJWFnum[:3], rho)
+    a = eosMDJWFnum[5]*s
+    a += eosMDJWFnum[4]*t
+    a += eosMDJWFnum[3]
+    a *= s
+    rho += a
+    _horner(t2, eosMDJWFnum[9:11], a)
+    a *= p
+    a += eosMDJWFnum[8]*s
+    a += eosMDJWFnum[7]*t2
+    a += eosMDJWFnum[6]
+    a *= p
+    rho += a
+    # denominator
+    den = _horner(t, [eosMDJWFden[12]] + eosMDJWFden[:4])
+    _horner(t2, eosMDJWFden[7:9], a)
+    a *= np.sqrt(s)
+    b = _horner(t2, eosMDJWFden[5:7])
+    b *= t
+    a += b
+    a += eosMDJWFden[4]
+    a *= s
+    den += a
+    np.multiply(eosMDJWFden[10], t2, out=a)
+    a += eosMDJWFden[11]*p
+    a *= p
+    a *= t
+    a += eosMDJWFden[9]
+    a *= p
+    den += a
+    den += epsln
+    rho /= den
+    return rho
 
-def mdjwf(salt,theta,p,epsln=0):
+def mdjwf(salt,theta,p,epsln=0,out=None,dtype=np.float64):
     """
     Computes in-situ density of sea water
 
@@ -582,6 +620,10 @@ def mdjwf(salt,theta,p,epsln=0):
     p : array_like
         sea pressure [dbar]. p may have dims 1x1,
         mx1, 1xn or mxn for salt(mxn)
+    out : ndarray, optional
+        array of the broadcast shape of the inputs to store the result in
+    dtype : data type
+        floating point type of the computation (default float64)
 
     Returns
     -------
@@ -598,80 +640,55 @@ def mdjwf(salt,theta,p,epsln=0):
     - McDougall et al., 2003, JAOT 20(5), pp. 730-741
     - Converted to python by Gavilan on 2024-07-18
     """
+    return _evaluate(_mdjwf, (salt, theta, p), out, dtype, epsln=epsln)
 
-    # make sure arguments are floating point
-    s = np.asarray(s, dtype=np.float64)
-    t = np.asarray(theta, dtype=np.float64)
-    p = np.asarray(p, dtype=np.float64)
-
-    _check_dimensions(s,t,p)
-
-    s = _check_salinity(s)
-
-    eosMDJWFnum = [   7.35212840e+00,
-                    - 5.45928211e-02,
-                      3.98476704e-04,
-                      2.96938239e+00,
-                    - 7.23268813e-03,
-                      2.12382341e-03,
-                      1.04004591e-02,
-                      1.03970529e-07,
-                      5.18761880e-06,
-                    - 3.24041825e-08,
-                    - 1.23869360e-11,
-                      9.99843699e+02
-                  ]
-
-    eosMDJWFden = [   7.28606739e-03,
-                    - 4.60835542e-05,
-                      3.68390573e-07,
-                      1.80809186e-10,
-                      2.14691708e-03,
-                    - 9.27062484e-06,
-                    - 1.78343643e-10,
-                      4.76534122e-06,
-                      1.63410736e-09,
-                      5.30848875e-06,
-                    - 3.03175128e-16,
-                    - 1.27934137e-17,
-                      1.00000000e+00
-                  ]
-
-    t1    = t
-    t2    = t1*t1
-    s1    = s
-    p1    = p
-
-    sp5 = np.sqrt(s1)
-    p1t1=p1*t1
-
-    num = ( eosMDJWFnum[11]
-            + t1*(eosMDJWFnum[0]
-                  + t1*(eosMDJWFnum[1] + eosMDJWFnum[2]*t1) )
-	    + s1*(eosMDJWFnum[3]
-                  + eosMDJWFnum[4]*t1  + eosMDJWFnum[5]*s1)
-	    + p1*(eosMDJWFnum[6] + eosMDJWFnum[7]*t2
-                  + eosMDJWFnum[8]*s1
-	          + p1*(eosMDJWFnum[9] + eosMDJWFnum[10]*t2) )
-    )
-    den = ( eosMDJWFden[12]
-            + t1*(eosMDJWFden[0]
-	          + t1*(eosMDJWFden[1]
-	                + t1*(eosMDJWFden[2] + t1*eosMDJWFden[3] ) ) )
-            + s1*(eosMDJWFden[4]
-	          + t1*(eosMDJWFden[5]
-	                + eosMDJWFden[6]*t2)
-	          + sp5*(eosMDJWFden[7] + eosMDJWFden[8]*t2) )
-	    + p1*(eosMDJWFden[9]
-	          + p1t1*(eosMDJWFden[10]*t2 + eosMDJWFden[11]*p1) )
-    )
-
-    denom = 1.0/(epsln+den)
-    rho = rhoNum*denom
-
+def _teos10(sa, ct, p, rho, epsln=0):
+    """ rho = num/(epsln + den), both in Horner form """
+    sqrtsa = np.sqrt(sa)
+    # numerator, into rho
+    _horner(ct, eosTEOS10[:4], rho)
+    a = _horner(ct, eosTEOS10[7:11])
+    a *= sqrtsa
+    a += _horner(ct, eosTEOS10[4:7])
+    a *= sa
+    rho += a
+    _horner(ct, eosTEOS10[16:19], a)
+    a += eosTEOS10[19]*sa
+    a *= p
+    b = _horner(ct, eosTEOS10[14:16])
+    b *= sa
+    a += b
+    a += _horner(ct, eosTEOS10[11:14])
+    a *= p
+    rho += a
+    # denominator
+    den = _horner(ct, eosTEOS10[20:25])
+    _horner(ct, eosTEOS10[30:35], a)
+    a *= sqrtsa
+    a += eosTEOS10[35]*sa
+    a += _horner(ct, eosTEOS10[25:30])
+    a *= sa
+    den += a
+    _horner(ct, eosTEOS10[46:48], a)
+    a *= p
+    np.multiply(eosTEOS10[45], sa, out=b)
+    b += eosTEOS10[44]*ct
+    b += eosTEOS10[43]
+    b *= ct
+    a += b
+    a += eosTEOS10[42]
+    a *= p
+    _horner(ct, eosTEOS10[40:42], b)
+    b *= sa
+    a += b
+    a += _horner(ct, eosTEOS10[36:40])
+    a *= p
+    den += a
+    den += epsln
+    rho /= den
     return rho
 
-def teos10(salt,theta,p,epsln=0):
+def teos10(salt,theta,p,epsln=0,out=None,dtype=np.float64):
     """
     Computes in-situ density of sea water
 
@@ -687,6 +704,10 @@ def teos10(salt,theta,p,epsln=0):
     p : array_like
         sea pressure [dbar]. p may have dims 1x1,
         mx1, 1xn or mxn for s(mxn)
+    out : ndarray, optional
+        array of the broadcast shape of the inputs to store the result in
+    dtype : data type
+        floating point type of the computation (default float64)
 
     Returns
     -------
@@ -702,91 +723,272 @@ def teos10(salt,theta,p,epsln=0):
     -----
     - Converted to python by Gavilan on 2024-07-18
     """
+    return _evaluate(_teos10, (salt, theta, p), out, dtype, epsln=epsln)
 
-    # make sure arguments are floating point
-    sa = np.asfarray(salt)
-    ct = np.asfarray(theta)
-    p = np.asfarray(p)
-
-    _check_dimensions(sa,ct,p)
-
-    sa = _check_salinity(sa)
-
-    teos = [   9.998420897506056e+02,
-               2.839940833161907e00,
-             - 3.147759265588511e-02,
-               1.181805545074306e-03,
-             - 6.698001071123802e00,
-             - 2.986498947203215e-02,
-               2.327859407479162e-04,
-             - 3.988822378968490e-02,
-               5.095422573880500e-04,
-             - 1.426984671633621e-05,
-               1.645039373682922e-07,
-             - 2.233269627352527e-02,
-             - 3.436090079851880e-04,
-               3.726050720345733e-06,
-             - 1.806789763745328e-04,
-               6.876837219536232e-07,
-             - 3.087032500374211e-07,
-             - 1.988366587925593e-08,
-             - 1.061519070296458e-11,
-               1.550932729220080e-10,
-               1.000000000000000e00,
-               2.775927747785646e-03,
-             - 2.349607444135925e-05,
-               1.119513357486743e-06,
-               6.743689325042773e-10,
-             - 7.521448093615448e-03,
-             - 2.764306979894411e-05,
-               1.262937315098546e-07,
-               9.527875081696435e-10,
-             - 1.811147201949891e-11,
-             - 3.303308871386421e-05,
-               3.801564588876298e-07,
-             - 7.672876869259043e-09,
-             - 4.634182341116144e-11,
-               2.681097235569143e-12,
-               5.419326551148740e-06,
-             - 2.742185394906099e-05,
-             - 3.212746477974189e-07,
-               3.191413910561627e-09,
-             - 1.931012931541776e-12,
-             - 1.105097577149576e-07,
-               6.211426728363857e-10,
-             - 1.119011592875110e-10,
-             - 1.941660213148725e-11,
-             - 1.864826425365600e-14,
-               1.119522344879478e-14,
-             - 1.200507748551599e-15,
-               6.057902487546866e-17,
-           ]
-
+def _secant_rab(s, t, p, rho, alpha, beta, kfw, ksw, kp):
+    """ rho, alpha and beta for jmd95 and unesco, p in dbar """
+    sqrts = np.sqrt(s)
+    # convert pressure to bar
+    p = .1*p
+    # density at the surface and its derivatives
+    a = _horner(t, eosJMDCSw[:5])
+    b = _horner(t, eosJMDCSw[5:8])
+    rho0 = _horner(t, eosJMDCFw) + s*(a + sqrts*b + eosJMDCSw[8]*s)
+    drho0ds = a + 1.5*sqrts*b + 2*eosJMDCSw[8]*s
+    drho0dt = ( _dhorner(t, eosJMDCFw)
+              + s*(_dhorner(t, eosJMDCSw[:5])
+                   + sqrts*_dhorner(t, eosJMDCSw[5:8])) )
+    # secant bulk modulus and its derivatives
+    a = _horner(t, ksw[:4])
+    b = _horner(t, ksw[4:7])
+    kp1 = _horner(t, kp[4:7])
+    kp3 = _horner(t, kp[11:14])
+    bulkmod = ( _horner(t, kfw) + s*(a + sqrts*b)
+              + p*(_horner(t, kp[:4]) + s*(kp1 + kp[7]*sqrts)
+                   + p*(_horner(t, kp[8:11]) + s*kp3)) )
+    dkds = a + 1.5*sqrts*b + p*(kp1 + 1.5*kp[7]*sqrts + p*kp3)
+    dkdt = ( _dhorner(t, kfw)
+           + s*(_dhorner(t, ksw[:4]) + sqrts*_dhorner(t, ksw[4:7]))
+           + p*(_dhorner(t, kp[:4]) + s*_dhorner(t, kp[4:7])
+                + p*(_dhorner(t, kp[8:11]) + s*_dhorner(t, kp[11:14]))) )
+    # rho = rho0/(1 - p/K): d(log rho) = d(log rho0) - p/(K*(K - p)) dK
+    a = bulkmod - p
+    np.multiply(rho0, bulkmod, out=rho)
+    rho /= a
+    a *= bulkmod
+    np.divide(p, a, out=a)
+    rho0 = 1./rho0
+    np.multiply(a, dkdt, out=alpha)
+    alpha -= drho0dt*rho0
+    np.multiply(drho0ds, rho0, out=beta)
+    beta -= a*dkds
+    return rho, alpha, beta
+
+def _mdjwf_rab(s, t, p, rho, alpha, beta, epsln=0):
+    """ rho, alpha and beta for mdjwf """
+    t2 = t*t
+    sqrts = np.sqrt(s)
+    num = ( _horner(t, [eosMDJWFnum[11]] + eosMDJWFnum[:3])
+          + s*(eosMDJWFnum[3] + eosMDJWFnum[4]*t + eosMDJWFnum[5]*s)
+          + p*(eosMDJWFnum[6] + eosMDJWFnum[7]*t2 + eosMDJWFnum[8]*s
+               + p*(eosMDJWFnum[9] + eosMDJWFnum[10]*t2)) )
+    dnumdt = ( _dhorner(t, [eosMDJWFnum[11]] + eosMDJWFnum[:3])
+             + eosMDJWFnum[4]*s
+             + 2*p*t*(eosMDJWFnum[7] + eosMDJWFnum[10]*p) )
+    dnumds = ( eosMDJWFnum[3] + eosMDJWFnum[4]*t + 2*eosMDJWFnum[5]*s
+             + eosMDJWFnum[8]*p )
+    a = _horner(t2, eosMDJWFden[5:7])
+    b = _horner(t2, eosMDJWFden[7:9])
+    den = ( _horner(t, [eosMDJWFden[12]] + eosMDJWFden[:4])
+          + s*(eosMDJWFden[4] + t*a + sqrts*b)
+          + p*(eosMDJWFden[9] + p*t*(eosMDJWFden[10]*t2 + eosMDJWFden[11]*p))
+          + epsln )
+    ddendt = ( _dhorner(t, [eosMDJWFden[12]] + eosMDJWFden[:4])
+             + s*(eosMDJWFden[5] + 3*eosMDJWFden[6]*t2
+                  + 2*eosMDJWFden[8]*sqrts*t)
+             + p*p*(3*eosMDJWFden[10]*t2 + eosMDJWFden[11]*p) )
+    ddends = eosMDJWFden[4] + t*a + 1.5*sqrts*b
+    # rho = num/den: d(log rho) = dnum/num - dden/den
+    np.divide(num, den, out=rho)
+    num = 1./num
+    den = 1./den
+    np.multiply(ddendt, den, out=alpha)
+    alpha -= dnumdt*num
+    np.multiply(dnumds, num, out=beta)
+    beta -= ddends*den
+    return rho, alpha, beta
+
+def _teos10_rab(sa, ct, p, rho, alpha, beta, epsln=0):
+    """ rho, alpha and beta for teos10 """
     sqrtsa = np.sqrt(sa)
+    T = eosTEOS10
+    a = _horner(ct, T[4:7])
+    b = _horner(ct, T[7:11])
+    c = _horner(ct, T[14:16])
+    num = ( _horner(ct, T[:4]) + sa*(a + sqrtsa*b)
+          + p*(_horner(ct, T[11:14]) + sa*c
+               + p*(_horner(ct, T[16:19]) + T[19]*sa)) )
+    dnumds = a + 1.5*sqrtsa*b + p*(c + p*T[19])
+    dnumdt = ( _dhorner(ct, T[:4])
+             + sa*(_dhorner(ct, T[4:7]) + sqrtsa*_dhorner(ct, T[7:11]))
+             + p*(_dhorner(ct, T[11:14]) + sa*T[15]
+                  + p*_dhorner(ct, T[16:19])) )
+    a = _horner(ct, T[25:30])
+    b = _horner(ct, T[30:35])
+    c = _horner(ct, T[40:42])
+    den = ( _horner(ct, T[20:25]) + sa*(a + T[35]*sa + sqrtsa*b)
+          + p*(_horner(ct, T[36:40]) + sa*c
+               + p*(T[42] + ct*(T[43] + T[44]*ct + T[45]*sa)
+                    + p*_horner(ct, T[46:48])))
+          + epsln )
+    ddends = a + 2*T[35]*sa + 1.5*sqrtsa*b + p*(c + p*T[45]*ct)
+    ddendt = ( _dhorner(ct, T[20:25])
+             + sa*(_dhorner(ct, T[25:30]) + sqrtsa*_dhorner(ct, T[30:35]))
+             + p*(_dhorner(ct, T[36:40]) + sa*T[41]
+                  + p*(T[43] + 2*T[44]*ct + T[45]*sa + p*T[47])) )
+    # rho = num/den: d(log rho) = dnum/num - dden/den
+    np.divide(num, den, out=rho)
+    num = 1./num
+    den = 1./den
+    np.multiply(ddendt, den, out=alpha)
+    alpha -= dnumdt*num
+    np.multiply(dnumds, num, out=beta)
+    beta -= ddends*den
+    return rho, alpha, beta
+
+_rab_kernels = {
+    'jmd95':  (_secant_rab, dict(kfw=eosJMDCKFw, ksw=eosJMDCKSw,
+                                 kp=eosJMDCKP)),
+    'unesco': (_secant_rab, dict(kfw=eosUNESCOKFw, ksw=eosUNESCOKSw,
+                                 kp=eosUNESCOKP)),
+    'mdjwf':  (_mdjwf_rab, {}),
+    'teos10': (_teos10_rab, {}),
+}
+
+def rho_alpha_beta(eos,salt,theta,p,epsln=0,out=None,dtype=np.float64):
+    """
+    Computes in-situ density, thermal expansion and haline contraction
+    coefficients of sea water
 
-    rhoNum = (teos[0]
-              + ct*(teos[1] + ct*(teos[2] + teos[3]*ct))
-              + sa*(teos[4] + ct*(teos[5] + teos[6]*ct)
-              + sqrtsa*(teos[7] + ct*(teos[8]
-              + ct*(teos[9] + teos[10]*ct))))
-              + p*(teos[11] + ct*(teos[12] + teos[13]*ct)
-              + sa*(teos[14] + teos[15]*ct)
-              + p*(teos[16] + ct*(teos[17] + teos[18]*ct) + teos[19]*sa)))
-
-    den = (teos[20]
-           + ct*(teos[21] + ct*(teos[22] + ct*(teos[23] + teos[24]*ct)))
-           + sa*(teos[25] + ct*(teos[26] + ct*(teos[27]
-           + ct*(teos[28] + teos[29]*ct)))
-           + teos[35]*sa
-           + sqrtsa*(teos[30] + ct*(teos[31] + ct*(teos[32]
-           + ct*(teos[33] + teos[34]*ct)))))
-           + p*(teos[36] + ct*(teos[37] + ct*(teos[38] + teos[39]*ct))
-           + sa*(teos[40] + teos[41]*ct)
-           + p*(teos[42] + ct*(teos[43] + teos[44]*ct + teos[45]*sa)
-           + p*(teos[46] + teos[47]*ct))))
-
-    rhoden = 1.0/(epsln+den)
-
-    rho = rhoNum*rhoden
+    The derivatives are computed analytically in the same pass over the
+    data as the density, sharing the polynomial terms.
 
-    return rho
+    Parameters
+    ----------
+    eos : string or function
+        equation of state: 'jmd95', 'unesco', 'mdjwf' or 'teos10'
+        (or one of these functions)
+    salt : array_like
+        salinity [psu (PSS-78)], absolute salinity [g/kg] for teos10
+    theta : array_like
+        potential temperature [degree C (IPTS-68)], conservative
+        temperature for teos10
+    p : array_like
+        sea pressure [dbar]
+    epsln : float
+        as for mdjwf and teos10
+    out : tuple of 3 ndarrays, optional
+        arrays of the broadcast shape of the inputs to store the results in
+    dtype : data type
+        floating point type of the computation (default float64)
+
+    Returns
+    -------
+    dens : array
+        density [kg/m^3]
+    alpha : array
+        thermal expansion coefficient -1/rho drho/dtheta [1/degree C]
+    beta : array
+        haline contraction coefficient 1/rho drho/dsalt [1/psu] or [kg/g]
+
+    Example
+    -------
+    >>> rho,alpha,beta = dens.rho_alpha_beta('jmd95', 35.5, 3., 3000.)
+    >>> N2 = 9.81*(alpha*dthetadz - beta*dsaltdz)  # z upward
+    """
+    eos = getattr(eos, '__name__', eos)
+    try:
+        kernel,kwargs = _rab_kernels[eos]
+    except KeyError:
+        raise ValueError('eos must be one of '
+                         + ', '.join(sorted(_rab_kernels)))
+    if kernel is not _secant_rab:
+        kwargs = dict(epsln=epsln)
+
+    return _evaluate(kernel, (salt, theta, p), out, dtype, nout=3, **kwargs)
+
+def _blocks(shape, block):
+    """ index tuples of slabs of at most block elements (at least one row
+        of the last axis) covering an array of the given shape """
+    # axes k: are whole, axis k-1 is split
+    size = 1
+    k = len(shape)
+    while k > 0 and size*shape[k-1] <= block:
+        k -= 1
+        size *= shape[k]
+    if k == 0:
+        return [ () ]
+    n = max(1, block//size)
+    return [ ind + (slice(i0, i0+n),)
+             for ind in np.ndindex(*shape[:k-1])
+             for i0 in range(0, shape[k-1], n) ]
+
+def _blockof(x, ndim, ind):
+    """ the part of x (broadcast to ndim dimensions) in block ind """
+    xshape = np.shape(x)
+    if len(xshape) == 0:
+        return x
+    ind = ind + (ndim - len(ind))*(slice(None),)
+    ind = ind[ndim-len(xshape):]
+    return x[tuple( i if n != 1 else 0 if isinstance(i, int) else slice(None)
+                    for i,n in zip(ind, xshape) )]
+
+def apply_blocked(func,salt,theta,p,block=2**22,workers=None,out=None,
+                  **kwargs):
+    """
+    Evaluate an equation of state block by block
+
+    Calls func for slabs of about block elements of the (broadcast)
+    inputs and writes the results into out, so only one block of each
+    input has to be in memory at a time.  The inputs can be memory maps
+    or lazy arrays that read data when indexed (like MDSArray).
+
+    Parameters
+    ----------
+    func : callable
+        equation of state with arguments (salt, theta, p, out=..., **kwargs),
+        e.g., jmd95, unesco, mdjwf or teos10
+    salt, theta, p : array_like
+        arguments of func; arrays smaller than the broadcast shape are
+        broadcast
+    block : int
+        number of elements per block (default 2**22); blocks are slabs
+        along the leading axes
+    workers : int or None
+        number of threads evaluating blocks concurrently
+    out : ndarray, optional
+        array of the broadcast shape of the inputs to store the result in,
+        e.g., a memory map (default: a new float64 array)
+    **kwargs
+        further arguments for func (like epsln)
+
+    Returns
+    -------
+    dens : array
+        out
+
+    Example
+    -------
+    >>> S = rdmds('S', 2880, astype=None, copy=False)  # memory maps
+    >>> T = rdmds('T', 2880, astype=None, copy=False)
+    >>> p = pfromz(rdmds('RC'))  # [dbar], shape (Nr, 1, 1)
+    >>> out = np.lib.format.open_memmap('rho.npy', 'w+', float, T.shape)
+    >>> rho = dens.apply_blocked(dens.jmd95, S, T, p, workers=4, out=out)
+    >>> rho = dens.apply_blocked(dens.jmd95, open_mds('S', np.nan),
+    ...                          open_mds('T', np.nan), p)
+    """
+    shape = np.broadcast_shapes(np.shape(salt), np.shape(theta), np.shape(p))
+    if out is None:
+        out = np.empty(shape)
+    elif out.shape != shape:
+        raise ValueError('out has shape {} instead of {}'.format(
+                         out.shape, shape))
+
+    ndim = len(shape)
+
+    def evaluate(ind):
+        func(*[ _blockof(x, ndim, ind) for x in (salt, theta, p) ],
+             out=out[ind + (Ellipsis,)], **kwargs)
+
+    blocks = _blocks(shape, block)
+    if workers is not None and workers > 1:
+        # numpy releases the GIL in the ufunc loops
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(workers) as pool:
+            for _ in pool.map(evaluate, blocks):
+                pass
+    else:
+        for ind in blocks:
+            evaluate(ind)
+
+    return out
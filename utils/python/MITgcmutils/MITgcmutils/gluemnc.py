@@ -0,0 +1,244 @@
+"""Usage: python -m MITgcmutils.gluemnc [-2|-5] [-q] [--help] [-j <workers>]
+                                   [-l <layout>] [-v <vars>] -o <outfile> <files>
+
+ -v <vars>    comma-separated list of variable names or glob patterns
+ -l <layout>  global layout: model, exch2 or faces (one output file per face,
+              <outfile> with .face<n> inserted before the extension);
+              default is exch2 if present, model otherwise
+ -j <workers> number of variables and records assembled in parallel
+ -2           write a NetCDF version 2 (64-Bit Offset) file
+ -5           write a NetCDF version 5 (CDF-5) file
+              default is the smallest version that can hold the data
+ -q           suppress progress messages
+ --help       show this help text
+
+<files> are the tile files, or a (quoted) glob pattern.  Files of several
+iterations (prefix.<iteration>.t<tile>.nc) are concatenated in time.
+
+Each variable is assembled one record at a time and written directly to its
+place in the output file, so only one record of a variable per worker has to
+fit in memory.
+
+Examples:
+
+python -m MITgcmutils.gluemnc -o state.nc mnc_*/state.*.t*.nc
+python -m MITgcmutils.gluemnc -j 8 -o ptr.nc -v 'BIO_*' 'mnc_*/ptr_tave.*.nc'
+"""
+from __future__ import print_function
+
+import os
+import sys
+import glob
+import fnmatch
+import numpy as np
+from .mnc import MNC, _splitmncname
+from .netcdf import netcdf_file, REVERSE
+from .mds import _pwrite
+
+# tile-specific global attributes that are not copied
+_tileattrs = ['tile_number', 'bi', 'bj']
+
+
+def _facename(outname, face):
+    root,ext = os.path.splitext(outname)
+    return '{}.face{}{}'.format(root, face, ext)
+
+
+def gluemnc(fpatt, outname, varnames=None, layout=None, version=None,
+            workers=None, maxopen=128, progress=False):
+    '''
+    Assemble an mnc file set into a global NetCDF file.
+
+    Parameters
+    ----------
+    fpatt : string or list of strings
+        glob pattern for the tile files, or list of tile file names.
+        Files of several iterations are concatenated in time.
+    outname : string
+        name of the output file
+    varnames : list of strings, optional
+        names or glob patterns of the variables to write (default all);
+        coordinate variables are always written
+    layout : string, optional
+        'model', 'exch2' or 'faces' (see mnc_files).  With 'faces', one file
+        is written per face, with .face<n> inserted in outname before the
+        extension.
+    version : {1, 2, 5}, optional
+        NetCDF version of the output (default: the smallest that can hold
+        the data)
+    workers : int or None
+        number of variable records assembled and written in parallel
+    maxopen : int
+        maximum number of tile files kept open
+    progress : bool
+        print the name of each variable as it is written
+
+    Returns
+    -------
+    list of strings
+        names of the files written
+
+    Notes
+    -----
+    Each variable is assembled one record at a time (using MNC) and written
+    with positioned writes directly to its place in the output file, which
+    is created with its full size first.  Memory use is one record of one
+    variable per worker.
+    '''
+    if isinstance(fpatt, str):
+        fnames = glob.glob(fpatt)
+    else:
+        fnames = list(fpatt)
+    if not fnames:
+        raise IOError('No files matching ' + str(fpatt))
+    # concatenate in time if all files are prefix.<iteration>.t<tile>.nc
+    # with more than one iteration (not, e.g., for grid.t<tile>.nc)
+    parts = [ _splitmncname(f) for f in fnames ]
+    multitime = (None not in parts
+                 and len(set(itr for d,prefix,itr,tile in parts)) > 1)
+
+    mnc = MNC(fnames, layout, multitime=multitime, maxopen=maxopen)
+    try:
+        nrec = getattr(mnc, 'nrec', 0)
+        names = [ name for name in mnc.variables
+                  if varnames is None or name in mnc.dimensions
+                  or any(fnmatch.fnmatchcase(name, patt) for patt in varnames) ]
+
+        gatts = dict((k, v) for k,v in mnc._attributes.items()
+                     if k not in _tileattrs)
+
+        if mnc.layout == 'faces':
+            outputs = [ (_facename(outname, face), f)
+                        for f,face in enumerate(mnc.faces) ]
+        else:
+            outputs = [ (outname, None) ]
+
+        ncs = []
+        tasks = []
+        try:
+            for fname,f in outputs:
+                dims = {}
+                for k,n in mnc.dimensions.items():
+                    if isinstance(n, np.ndarray):
+                        n = int(n[f])
+                    dims[k] = n
+                sizes = [ (tuple(dims[d] for d in mnc.variables[name].dimensions),
+                           mnc.variables[name].dtype) for name in names ]
+                nc = netcdf_file(fname, 'w', version=version or _minversion(sizes, nrec))
+                ncs.append(nc)
+                for k,v in gatts.items():
+                    setattr(nc, k, v)
+                for k,n in dims.items():
+                    nc.createDimension(k, n)
+                for name in names:
+                    var = mnc.variables[name]
+                    v = nc.createVariable(name, var.dtype, var.dimensions)
+                    for k,att in var._attributes.items():
+                        setattr(v, k, att)
+                    if var.isrec:
+                        tasks.extend((nc, f, name, rec) for rec in range(nrec))
+                    else:
+                        tasks.append((nc, f, name, None))
+
+                nc.write_header(nrec)
+
+            def write(task):
+                nc,f,name,rec = task
+                var = mnc.variables[name]
+                if f is not None:
+                    data = var.face(f, rec)
+                elif rec is not None:
+                    data = var[rec]
+                else:
+                    data = var[...]
+                data = np.ascontiguousarray(data)
+                if data.dtype.byteorder in '=<' and np.little_endian:
+                    data.byteswap(True)
+                _pwrite(nc.fp.fileno(), data, nc.data_offset(name, rec or 0))
+                if progress and not rec:
+                    print(name, file=sys.stderr)
+
+            if workers is not None and workers > 1:
+                from concurrent.futures import ThreadPoolExecutor
+                with ThreadPoolExecutor(workers) as pool:
+                    for _ in pool.map(write, tasks):
+                        pass
+            else:
+                for task in tasks:
+                    write(task)
+        finally:
+            for nc in ncs:
+                nc.close()
+    finally:
+        mnc.close()
+
+    return [ fname for fname,f in outputs ]
+
+
+def _minversion(sizes, nrec):
+    """ smallest NetCDF version that can hold variables of the given
+        (shape, dtype), with None for the record dimension """
+    size = 0
+    recsize = 0
+    maxsize = 0
+    for shape,dtype in sizes:
+        if (dtype.char, dtype.itemsize) not in REVERSE:
+            return 5
+        isrec = bool(shape) and shape[0] is None
+        vsize = int(np.prod(shape[isrec:], dtype=np.int64))*dtype.itemsize
+        vsize += -vsize % 4
+        maxsize = max(maxsize, vsize)
+        if isrec:
+            recsize += vsize
+        else:
+            size += vsize
+    if maxsize >= 2**32 - 4:
+        return 5
+    # all offsets (and the header) have to fit in 32 bits for version 1
+    if size + recsize*nrec >= 2**31 - 2**20:
+        return 2
+    return 1
+
+
+def main(argv=None):
+    from getopt import gnu_getopt as getopt
+    from getopt import GetoptError
+
+    try:
+        optlist,fnames = getopt(sys.argv[1:] if argv is None else argv,
+                                '25qhj:l:o:v:', ['help'])
+    except GetoptError as e:
+        sys.exit('Error: ' + str(e) + '\n\n' + __doc__)
+
+    opts = dict(optlist)
+
+    if '--help' in opts or '-h' in opts:
+        print(__doc__)
+        sys.exit()
+
+    if not fnames:
+        sys.exit('You need to specify at least one input file.')
+
+    outname = opts.get('-o')
+    if outname is None:
+        sys.exit('You need to specify an output file using the -o option.')
+
+    version = None
+    if '-2' in opts:
+        version = 2
+    if '-5' in opts:
+        version = 5
+
+    varnames = None
+    if '-v' in opts:
+        varnames = [ patt.strip() for patt in opts['-v'].split(',') ]
+
+    if len(fnames) == 1:
+        fnames = fnames[0]
+
+    gluemnc(fnames, outname, varnames, layout=opts.get('-l'), version=version,
+            workers=int(opts.get('-j', 1)), progress='-q' not in opts)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,188 @@
+"""Usage: python -m MITgcmutils.joinmds [-q] [--help] [-j <workers>] [-d <outdir>] <fname> ...
+
+ -j <workers> number of threads reading tiles and writing records
+ -d <outdir>  directory for the global files (default: current directory)
+ -q           do not report the files written
+ --help       show this help text
+
+Join the tile files <fname>.???.???.data/meta of an mds file set into a
+global file pair <outdir>/<fname>.data/meta, like MITgcm with
+globalFiles=.TRUE.  <fname> has no tile suffix and may contain a glob
+pattern for the directories.  If it has no iteration number, all
+iterations are joined.  exch2 and llc tiles are placed according to
+map2glob.
+
+The global data file is written in chunks of whole records (at least one),
+each assembled in memory from all tiles and written at its place in the
+file, several in parallel.
+
+Examples:
+
+python -m MITgcmutils.joinmds T.0000072000
+python -m MITgcmutils.joinmds -j 8 -d global 'mnc_*/T' 'mnc_*/S'
+"""
+from __future__ import print_function
+
+import os
+import re
+import sys
+import functools
+from operator import mul
+import numpy as np
+from .mds import (findmeta, scanforfiles, tilepieces, _pwrite, _typesuffixes,
+                  _chunksize)
+
+_dimlist_pattern = re.compile(r'^ *dimList *= *\[[^]]*\] *; *\n?', re.MULTILINE)
+_map2glob_pattern = re.compile(r'^ *map2glob *= *\[[^]]*\] *; *\n?', re.MULTILINE)
+
+
+def joinmds(fname, outname=None, workers=None, chunksize=_chunksize):
+    '''
+    Join the tile files of an mds file set into a global file pair.
+
+    Parameters
+    ----------
+    fname : string
+        name of the file set without tile suffix and '.meta', e.g.,
+        'T.0000072000' or 'res_*/T.0000072000'
+    outname : string
+        name of the global files without '.data' and '.meta' (default: the
+        base name of fname in the current directory)
+    workers : int or None
+        number of threads, each assembling and writing a chunk of records
+    chunksize : int
+        number of elements per chunk; chunks hold at least one record
+
+    Returns
+    -------
+    string
+        outname
+
+    Notes
+    -----
+    Tiles are placed with the same logic as rdmds (tilepieces), including
+    map2glob for exch2 and llc files.  Data are copied without conversion.
+    Parts of the global array not covered by any tile (blank tiles) are
+    zero.  The meta file is that of the first tile with global dimensions
+    and without map2glob, and is written last.
+    '''
+    metafiles,metainfos = findmeta(fname)
+    metainfos = list(metainfos)
+    if len(metafiles) == 0:
+        raise IOError('No files found for ' + fname + '.meta')
+    if metafiles == [fname + '.meta']:
+        raise ValueError(fname + ' is not tiled')
+
+    if outname is None:
+        outname = os.path.basename(fname)
+
+    gdims,i0s,ies,_,_,_,meta = metainfos[0]
+    try:
+        dataprec, = meta['dataprec']
+    except KeyError:
+        dataprec, = meta['format']
+    tp = '>' + _typesuffixes[dataprec]
+    size = np.dtype(tp).itemsize
+    nrecords, = meta['nrecords']
+    gny,gnx = gdims[-2:]
+    count = functools.reduce(mul, gdims)
+    nrecchunk = max(1, chunksize // count)
+
+    # where each tile goes
+    tiles = []
+    for metafile,(tdims,i0s,ies,_,_,map2gl,_) in zip(metafiles, metainfos):
+        if tdims != gdims:
+            raise ValueError('Global dimensions differ: ' + metafile)
+        pieces = tilepieces(i0s, ies, map2gl, gny, gnx)
+        sl = tuple( slice(i0,ie) for i0,ie in zip(i0s[:-2],ies[:-2]) )
+        recshape = tuple( ie-i0 for i0,ie in zip(i0s,ies) )
+        tiles.append((metafile[:-4] + 'data', pieces, sl, recshape))
+
+    with open(outname + '.data', 'wb') as f:
+        f.truncate(nrecords*count*size)
+        fd = f.fileno()
+
+        def writechunk(rec0):
+            """ assemble records rec0:rec0+nrecchunk and write them """
+            nrec = min(nrecchunk, nrecords - rec0)
+            arr = np.zeros((nrec,) + gdims, tp)
+            for datafile,pieces,sl,recshape in tiles:
+                tilecount = functools.reduce(mul, recshape)
+                data = np.empty((nrec,) + recshape, tp)
+                with open(datafile, 'rb') as ft:
+                    ft.seek(rec0*tilecount*size)
+                    if ft.readinto(data) != data.nbytes:
+                        raise IOError('Unexpected end of file ' + datafile)
+                a = arr[(slice(None),) + sl]
+                for r0,r1,c0,c1,j0,js,i0 in pieces:
+                    a[...,j0:j0+js*(r1-r0):js,i0:i0+c1-c0] = data[...,r0:r1,c0:c1]
+            _pwrite(fd, arr, rec0*count*size)
+
+        recs = range(0, nrecords, nrecchunk)
+        if workers is not None and workers > 1:
+            # file reads and writes release the GIL
+            from concurrent.futures import ThreadPoolExecutor
+            with ThreadPoolExecutor(workers) as pool:
+                for _ in pool.map(writechunk, recs):
+                    pass
+        else:
+            for rec0 in recs:
+                writechunk(rec0)
+
+    with open(metafiles[0]) as f:
+        text = f.read()
+    if max(gdims) < 10000:
+        fmt = '{:5d}'
+    else:
+        fmt = '{:10d}'
+    fmt = fmt + ',' + fmt + ',' + fmt
+    dimlist = (" dimList = [\n " +
+               ",\n ".join(fmt.format(d,1,d) for d in gdims[::-1]) +
+               "\n ];\n")
+    text = _dimlist_pattern.sub(lambda m: dimlist, text)
+    text = _map2glob_pattern.sub('', text)
+    with open(outname + '.meta', 'w') as f:
+        f.write(text)
+
+    return outname
+
+
+def main(argv=None):
+    from getopt import gnu_getopt as getopt
+    from getopt import GetoptError
+
+    try:
+        optlist,fnames = getopt(sys.argv[1:] if argv is None else argv,
+                                'qhj:d:', ['help'])
+    except GetoptError as e:
+        sys.exit('Error: ' + str(e) + '\n\n' + __doc__)
+
+    opts = dict(optlist)
+
+    if '--help' in opts or '-h' in opts:
+        print(__doc__)
+        sys.exit()
+
+    if not fnames:
+        sys.exit('You need to specify at least one file name.')
+
+    outdir = opts.get('-d', '.')
+    workers = int(opts.get('-j', 1))
+
+    for fname in fnames:
+        metafiles,_ = findmeta(fname)
+        if metafiles:
+            names = [fname]
+        else:
+            names = [ fname + '.{0:010d}'.format(it) for it in scanforfiles(fname) ]
+            if not names:
+                sys.exit('No files found for ' + fname)
+        for name in names:
+            outname = os.path.join(outdir, os.path.basename(name))
+            joinmds(name, outname, workers)
+            if '-q' not in opts:
+                print(outname + '.data')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,15 @@
+import os
 import sys
 import re
 import glob
+import functools
+import json
+import time
+import threading
 import numpy as np
 from operator import mul
+from collections import OrderedDict
+from ._cache import _LRUCache
 
 debug = False
 
@@ -53,14 +60,13 @@ _string_pattern = re.compile(r"'(.*)'$")
 
 def _parse1(s):
     """ convert one item to appropriate type """
-    m = _string_pattern.match(s)
-    if m:
-        s = m.group(1)
-        # unquote quotes
-        s = re.sub(r"''","'",s)
-        return s
+    if s[:1] == "'":
+        m = _string_pattern.match(s)
+        if m:
+            # unquote quotes
+            return m.group(1).replace("''", "'")
 
-    if '.' in s or 'e' in s.lower():
+    if '.' in s or 'e' in s or 'E' in s:
         return float(s)
     else:
         try:
@@ -73,17 +79,97 @@ _closing = {'[':']',
             '{':'}',
            }
 
+_split_list = re.compile(r'[, ] *').split
+_split_strings = re.compile(r"'  *'").split
+
+def _parsevalues(opening, line):
+    """ convert the contents of [] or {} into a list """
+    global _currentline
+    # remove delimiters
+    line = line.strip(" ,")
+    _currentline = line
+
+    if opening == '[':
+        # [] can contain any type of values, separated by commas
+        return [ _parse1(s) for s in _split_list(line) ]
+    else:
+        # {} can only contain single quote-delimited strings separated by space
+        return [ s.rstrip() for s in _split_strings(line.strip("'")) ]
+
+
+# one entry, "key = [ ... ];" or "key = { ... };", possibly spanning several
+# lines and preceded by blank lines
+_entry_pattern = re.compile(
+        r'(?:[ \t\r\f\v]*\n)* *(\w*) *= *(?:(\[)([^]]*)\]|(\{)([^}]*)\}); *(?:\n|\Z)')
+_blank_pattern = re.compile(r'\s*\Z')
+
 def parsemeta(metafile):
     """ parses metafile (file object or filename) into a dictionary of lists
         of floats, ints or strings
     """
-    global _currentline
-
     try:
-        lines = open(metafile)
+        with open(metafile) as f:
+            text = f.read()
     except TypeError:
-        lines = iter(metafile)
+        try:
+            text = metafile.read()
+        except AttributeError:
+            text = ''.join(metafile)
+
+    return _parsemetatext(text, metafile)
+
+
+def _parsemetatext(text, metafile):
+    """ parse the contents of a meta file in one pass
+
+    Regular files are tokenized with a single regular expression.  For
+    anything unusual, fall back to the line-by-line parser, so results and
+    errors are the same in all cases.
+    """
+    raw = text
+    if '/' in text:
+        stripped = []
+        text = _comment_pattern.sub(lambda m: stripped.append(m.group(0)) or
+                                    _comment_replacer(m), text)
+        # a comment or string spanning lines would be treated differently
+        # when stripping comments line by line
+        if any( '\n' in c for c in stripped ):
+            return _parsemetalines(_iterlines(raw), metafile)
+
+    d = {}
+    pos = 0
+    match = _entry_pattern.match
+    while True:
+        m = match(text, pos)
+        if m is None:
+            break
+        key,lopen,lval,sopen,sval = m.groups()
+        opening = lopen or sopen
+        line = lval if lopen else sval
+        if '\n' in line:
+            # join continuation lines like the line-by-line parser
+            parts = line.split('\n')
+            line = (parts[0].rstrip(' ')
+                    + ''.join(' ' + part.rstrip() for part in parts[1:-1])
+                    + ' ' + parts[-1])
+        d[key] = _parsevalues(opening, line)
+        pos = m.end()
+
+    if not _blank_pattern.match(text, pos):
+        return _parsemetalines(_iterlines(raw), metafile)
+
+    return d
+
+
+def _iterlines(text):
+    """ iterate over lines like a file object does """
+    lines = text.split('\n')
+    last = lines.pop()
+    return iter([ line + '\n' for line in lines ] + ([last] if last else []))
 
+
+def _parsemetalines(lines, metafile):
+    """ parse an iterator over the lines of a meta file """
     d = {}
     for line in lines:
         line = strip_comments(line)
@@ -117,20 +203,95 @@ def parsemeta(metafile):
             raise ParseError(metafile,line,
                              'Values must be enclosed in "[ ];" or "{ };".')
 
-        # remove delimiters
-        line = line[1:-2].strip(" ,")
-        _currentline = line
+        d[key] = _parsevalues(opening, line[1:-2])
 
-        if opening == '[':
-            # [] can contain any type of values, separated by commas
-            val = [ _parse1(s) for s in re.split(r'[, ] *',line) ]
-        else:
-            # {} can only contain single quote-delimited strings separated by space
-            val = [ s.rstrip() for s in re.split(r"'  *'", line.strip("'")) ]
+    return d
 
-        d[key] = val
+################################################################################
+# caching of meta data
+
+# glob results, keyed by absolute and given pattern and validated by directory
+# modification times
+_globcache = _LRUCache(1024)
+# results of readmeta, keyed by (absolute path, mtime, size)
+_metacache = _LRUCache(65536)
+# parsed meta files without time-specific entries, i.e., one per tile layout
+_layoutcache = _LRUCache(65536)
+# tile-to-global index maps from tilepieces
+_tilecache = _LRUCache(65536)
+# index files written by build_index, keyed by (absolute path, mtime, size)
+_indexcache = _LRUCache(64)
+
+_caches = OrderedDict([('glob', _globcache),
+                       ('meta', _metacache),
+                       ('layout', _layoutcache),
+                       ('tiles', _tilecache),
+                       ('index', _indexcache),
+                      ])
+
+def clear_cache():
+    """ clear the caches of file lists, meta data and tile layouts """
+    for c in _caches.values():
+        c.clear()
+
+
+def cache_info():
+    """ return statistics for the meta data caches
 
-    return d
+    Returns
+    -------
+    info : dict
+        for each cache ('glob', 'meta', 'layout', 'tiles', 'index'), a dictionary with
+        the number of hits and misses, the current size and the maximum size
+    """
+    return dict((k, c.info()) for k,c in _caches.items())
+
+
+_magic_pattern = re.compile('[*?[]')
+
+def _dirstamp(dirs):
+    """ modification times of directories, None if one does not exist """
+    try:
+        return tuple( os.stat(d or os.curdir).st_mtime_ns for d in dirs )
+    except OSError:
+        return None
+
+
+# modification times are only trusted to detect changes made at least this
+# many seconds later (some file systems, e.g., Lustre, store whole seconds)
+_mtime_resolution = 1.
+
+def cachedglob(pattern):
+    """ glob.glob with results cached as long as the directories involved
+        are not modified """
+    # the absolute pattern tells directories with equal modification times
+    # apart (e.g., after os.chdir); the results are relative to the given one
+    key = (os.path.abspath(pattern), pattern)
+    res = _globcache.get(key)
+    if res is not None:
+        dirs,stamp,files = res
+        if _dirstamp(dirs) == stamp:
+            return list(files)
+
+    t0 = time.time()
+    files = glob.glob(pattern)
+    # directories that can gain or lose matches: those containing matches and
+    # the deepest directory of the pattern without wildcards
+    parts = os.path.dirname(pattern).split(os.sep)
+    static = []
+    for part in parts:
+        if _magic_pattern.search(part):
+            break
+        static.append(part)
+    dirs = set( os.path.dirname(f) for f in files )
+    dirs.add(os.sep.join(static))
+    dirs = tuple(sorted(dirs))
+    stamp = _dirstamp(dirs)
+    # a directory modified within _mtime_resolution of the glob may change
+    # again without a new modification time
+    if stamp is not None and max(stamp) < (t0 - _mtime_resolution)*1e9:
+        _globcache.set(key, (dirs, stamp, tuple(files)))
+    return files
 
 ################################################################################
 
@@ -157,10 +318,13 @@ def fromfileshape(filename,dtype,shape=None,**kwargs):
 
 def scanforfiles(fname):
     """ return list of iteration numbers for which metafiles with base fname exist """
-    import glob
-    allfiles = glob.glob(fname + '.' + 10*'[0-9]' + '.001.001.meta')
+    itrs = _indexiterations(fname)
+    if itrs is not None:
+        return itrs
+
+    allfiles = cachedglob(fname + '.' + 10*'[0-9]' + '.001.001.meta')
     if len(allfiles) == 0:
-        allfiles = glob.glob(fname + '.' + 10*'[0-9]' + '.meta')
+        allfiles = cachedglob(fname + '.' + 10*'[0-9]' + '.meta')
         off = -5
     else:
         off = -13
@@ -171,8 +335,46 @@ def scanforfiles(fname):
 
 
 def readmeta(f):
-    """ read meta file and extract tile/timestep-specific parameters """
-    meta = parsemeta(f)
+    """ read meta file and extract tile/timestep-specific parameters
+
+    For file names, results are cached as long as the file's modification time
+    and size do not change, and the parsing of time-independent entries is
+    shared by all files with the same contents otherwise (see cache_info).
+    """
+    try:
+        st = os.stat(f)
+    except TypeError:
+        return _splitmeta(parsemeta(f))
+
+    key = (os.path.abspath(f), st.st_mtime_ns, st.st_size)
+    res = _metacache.get(key)
+    if res is None:
+        with open(f) as fp:
+            text = fp.read()
+        # timeStepNumber and timeInterval change from iteration to iteration;
+        # parse the rest only once for all files with the same layout
+        layout = _time_pattern.sub('', text)
+        meta = _layoutcache.get(layout)
+        if meta is None:
+            meta = _parsemetatext(layout, f)
+            _layoutcache.set(layout, meta)
+        meta = dict(meta)
+        timetext = ''.join( m.group(0) for m in _time_pattern.finditer(text) )
+        meta.update(_parsemetatext(timetext, f))
+        res = _splitmeta(meta)
+        _metacache.set(key, res)
+
+    # return copies, so callers can modify the results
+    res = [ list(a) if isinstance(a, list) else a for a in res ]
+    res[-1] = dict( (k, list(v)) for k,v in res[-1].items() )
+    return tuple(res)
+
+
+_time_pattern = re.compile(r'^ *(?:timeStepNumber|timeInterval) *= *\[[^]]*\] *; *\n?',
+                           re.MULTILINE)
+
+def _splitmeta(meta):
+    """ extract tile/timestep-specific parameters from parsed meta data """
     dimList = meta.pop('dimList')
     # pythonize
     gdims = tuple(dimList[-3::-3])
@@ -187,6 +389,306 @@ def readmeta(f):
     return gdims,i0s,ies,timeStepNumber,timeInterval,map2gl,meta
 
 
+################################################################################
+# index of mds files in a run directory
+
+MDSINDEX = 'mdsindex.json'
+
+_mdsname_pattern = re.compile(r'(.*?)(?:\.([0-9]{10}))?(\.[0-9]{3}\.[0-9]{3})?\.meta$')
+
+def build_index(rundir='.', indexname=MDSINDEX):
+    """
+    Write an index of all mds files in a directory.
+
+    The index lists the variables (file name prefixes), their iterations and
+    the parsed meta data of all tiles, with tile layouts and meta data common
+    to many files stored only once.  rdmds, scanforfiles and open_mds use it
+    instead of searching the directory and reading every meta file, turning
+    many file system operations into a single read.
+
+    The index is used only as long as no files are added to or removed from
+    the directory, so it should be built after the run has finished.
+    Building it takes at least a second, so that files added meanwhile are
+    noticed also where modification times are stored in whole seconds.
+    Wildcards in file names (e.g., 'res_*/T') bypass the index.
+
+    Parameters
+    ----------
+    rundir : string
+        directory containing mds files (default current directory)
+    indexname : string
+        name of the index file inside rundir (default 'mdsindex.json')
+
+    Returns
+    -------
+    path : string
+        path of the index file written
+
+    Example
+    -------
+    >>> build_index('run')
+    'run/mdsindex.json'
+    >>> T = rdmds('run/T', numpy.nan)
+    """
+    path = os.path.join(rundir, indexname)
+    tmppath = path + '.tmp'
+    while True:
+        names = set(os.listdir(rundir)) - set([indexname])
+        index = _scanrundir(rundir, names)
+        with open(tmppath, 'w') as f:
+            json.dump(index, f, separators=(',', ':'))
+        os.rename(tmppath, path)
+        st = os.stat(rundir)
+        # files added in the same second as the index would not change a
+        # modification time stored in whole seconds: wait until the
+        # directory's modification time is old enough to be trusted and
+        # scan again if files were added or removed meanwhile
+        time.sleep(max(0., st.st_mtime_ns/1e9 + _mtime_resolution - time.time()))
+        if (os.stat(rundir).st_mtime_ns == st.st_mtime_ns
+            and set(os.listdir(rundir)) - set([indexname]) == names):
+            break
+
+    # the index is valid as long as the directory is not modified afterwards
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns))
+    return path
+
+
+def _scanrundir(rundir, names):
+    """ collect meta data of the mds files among names in rundir for
+        build_index """
+    files = {}
+    for name in names:
+        if name.endswith('.meta'):
+            base,itr,suffix = _mdsname_pattern.match(name).groups()
+            files.setdefault(base, {}).setdefault(itr or '', []).append(suffix or '')
+
+    tilesets = []
+    tilesetids = {}
+    variables = {}
+    for base in sorted(files):
+        metas = []
+        iterations = {}
+        for itr,suffixes in sorted(files[base].items()):
+            tiles = []
+            metaref = None
+            timestep = timeinterval = None
+            for suffix in sorted(suffixes):
+                metafile = os.path.join(rundir, base + (itr and '.' + itr) + suffix + '.meta')
+                gdims,i0s,ies,timestep,timeinterval,map2gl,meta = readmeta(metafile)
+                if metaref is None:
+                    metaref = meta
+                elif meta != metaref:
+                    # not a consistent set of tiles, leave it to rdmds
+                    iterations[itr] = None
+                    break
+                tiles.append((suffix, i0s, ies, map2gl))
+            else:
+                key = json.dumps(tiles)
+                if key not in tilesetids:
+                    tilesetids[key] = len(tilesets)
+                    tilesets.append(tiles)
+                if metaref not in metas:
+                    metas.append(metaref)
+                iterations[itr] = (tilesetids[key], metas.index(metaref),
+                                   timestep, timeinterval)
+        variables[base] = dict(metas=metas, iterations=iterations)
+
+    return dict(version=1, tilesets=tilesets, variables=variables)
+
+
+def _loadindex(dirname):
+    """ return index for directory if there is a valid one, None otherwise """
+    path = os.path.join(dirname, MDSINDEX)
+    try:
+        st = os.stat(path)
+        dirmtime = os.stat(dirname or os.curdir).st_mtime_ns
+    except OSError:
+        return None
+
+    if st.st_mtime_ns < dirmtime:
+        # directory was modified after index was written
+        return None
+
+    key = (os.path.abspath(path), st.st_mtime_ns, st.st_size)
+    index = _indexcache.get(key)
+    if index is None:
+        with open(path) as f:
+            index = json.load(f)
+        _indexcache.set(key, index)
+    return index
+
+
+def _indexlookup(fname):
+    """ return list of meta file names and list of readmeta results for fname
+        (without tile suffix) from an index, or None if there is none """
+    if _magic_pattern.search(fname):
+        return None
+    dirname,name = os.path.split(fname)
+    index = _loadindex(dirname)
+    if index is None:
+        return None
+
+    base,itr,suffix = _mdsname_pattern.match(name + '.meta').groups()
+    try:
+        var = index['variables'][base]
+    except KeyError:
+        return [], []
+    try:
+        entry = var['iterations'][itr or '']
+    except KeyError:
+        return [], []
+    if entry is None:
+        # inconsistent tiles, search and read meta files
+        return None
+
+    tileset,imeta,timestep,timeinterval = entry
+
+    meta = var['metas'][imeta]
+    gdims = tuple(meta['dimList'][::-1])
+    metafiles = []
+    metainfos = []
+    for tilesuffix,i0s,ies,map2gl in index['tilesets'][tileset]:
+        if suffix and tilesuffix != suffix:
+            continue
+        # return copies, so callers can modify the results
+        if suffix:
+            # fname already ends in the tile suffix
+            metafiles.append(fname + '.meta')
+        else:
+            metafiles.append(fname + tilesuffix + '.meta')
+        metainfos.append((gdims, list(i0s), list(ies),
+                          timestep and list(timestep),
+                          timeinterval and list(timeinterval),
+                          map2gl and list(map2gl),
+                          dict( (k, list(v)) for k,v in meta.items() )))
+    return metafiles, metainfos
+
+
+def _indexiterations(fname):
+    """ return sorted iteration numbers for fname from an index, or None if
+        there is none """
+    if _magic_pattern.search(fname):
+        return None
+    dirname,name = os.path.split(fname)
+    index = _loadindex(dirname)
+    if index is None:
+        return None
+    try:
+        var = index['variables'][name]
+    except KeyError:
+        return []
+    return sorted( int(itr) for itr in var['iterations'] if itr )
+
+
+def findmeta(fname, mapper=map):
+    """ find the meta files for fname (without tile suffix) and read them
+
+    Uses the index written by build_index if there is a valid one.
+
+    Returns
+    -------
+    metafiles : list of strings
+        meta file names
+    metainfos : iterable
+        results of readmeta for each meta file
+    """
+    res = _indexlookup(fname)
+    if res is None:
+        metafiles = cachedglob(fname + 2*('.'+3*'[0-9]') + '.meta') or cachedglob(fname+'.meta')
+        return metafiles, mapper(readmeta, metafiles)
+    else:
+        return res
+
+
+def tilepieces(i0s, ies, map2gl, ny, nx):
+    """ compute where the x,y part of a tile goes in the global array
+
+    Returns a list of tuples (r0,r1,c0,c1,j0,js,i0): tile[...,r0:r1,c0:c1] goes
+    to glob[...,j0:j0+js*(r1-r0):js,i0:i0+c1-c0].  Without map2gl, this is just
+    the tile's rectangle.  With map2gl (exch2 global files), each row of the
+    tile starts jstride = map2gl[1]*nx + map2gl[0] after the previous one in
+    the flattened x,y dimensions.  Results are cached (see cache_info).
+    """
+    key = (tuple(i0s[-2:]), tuple(ies[-2:]), map2gl and tuple(map2gl), ny, nx)
+    pieces = _tilecache.get(key)
+    if pieces is None:
+        pieces = tuple(_tilepieces(i0s, ies, map2gl, ny, nx))
+        _tilecache.set(key, pieces)
+    return list(pieces)
+
+
+def _tilepieces(i0s, ies, map2gl, ny, nx):
+    j0 = i0s[-2]
+    i0 = i0s[-1]
+    nr = ies[-2] - j0
+    nc = ies[-1] - i0
+    if map2gl is None:
+        return [(0, nr, 0, nc, j0, 1, i0)]
+
+    jstride = map2gl[1]*nx + map2gl[0]
+    pieces = []
+    for r in range(nr):
+        j,i = divmod(nx*j0 + i0 + r*jstride, nx)
+        # rows may wrap around into the next global row
+        c = 0
+        while c < nc:
+            n = min(nc - c, nx - i)
+            if pieces:
+                pr0,pr1,pc0,pc1,pj0,pjs,pi0 = pieces[-1]
+                if (pr1 == r and (pc0,pc1,pi0) == (c,c+n,i) and j > pj0 and
+                        (pr1 - pr0 == 1 or j - pj0 == pjs*(pr1 - pr0))):
+                    # extend previous piece by one row
+                    pieces[-1] = (pr0,r+1,c,c+n,pj0,(j-pj0)//(r-pr0),i)
+                    c += n
+                    j += 1
+                    i = 0
+                    continue
+            pieces.append((r,r+1,c,c+n,j,1,i))
+            c += n
+            j += 1
+            i = 0
+
+    return pieces
+
+
+def _recordruns(recshape, levs, R0, R1):
+    """ offsets and lengths (in elements) of the contiguous runs in a record of
+        shape recshape that hold levels levs of the leading dimensions and
+        rows R0:R1 (all columns), in the order of the result; adjacent runs
+        are merged """
+    nlev = len(levs)
+    ny,nx = recshape[-2:]
+    strides = np.cumprod((1,) + recshape[:0:-1])[::-1]
+    inds = [ np.asarray(l) % d * st for l,d,st in zip(levs, recshape, strides) ]
+    if R0 == 0 and R1 == ny:
+        # everything after the level dimensions is contiguous
+        runlen = int(np.prod(recshape[nlev:]))
+    else:
+        inds += [ np.arange(d) * st for d,st in zip(recshape[nlev:-2], strides[nlev:-2]) ]
+        runlen = (R1-R0)*nx
+    offsets = R0*nx + sum(np.ix_(*inds), np.zeros((), int)).ravel()
+    # merge runs that follow each other in the file
+    starts = np.r_[0, np.nonzero(np.diff(offsets) != runlen)[0] + 1]
+    lengths = np.diff(np.r_[starts, len(offsets)]) * runlen
+    return [ (int(o), int(n)) for o,n in zip(offsets[starts], lengths) ]
+
+
+def _clippieces(pieces, ri0, rie, rj0, rje):
+    """ clip pieces as returned by tilepieces to the region
+        glob[...,rj0:rje,ri0:rie] and make them relative to the region """
+    clipped = []
+    for r0,r1,c0,c1,j0,js,i0 in pieces:
+        # overlapping columns
+        a = max(i0, ri0)
+        b = min(i0+c1-c0, rie)
+        # overlapping rows k, rj0 <= j0+js*k < rje
+        k0 = max(0, -((j0-rj0)//js))
+        k1 = min(r1-r0, -((j0-rje)//js))
+        if a < b and k0 < k1:
+            clipped.append((r0+k0, r0+k1, c0+a-i0, c0+b-i0, j0+js*k0-rj0, js, a-ri0))
+    return clipped
+
+
 _typeprefixes = {'ieee-be':'>',
                  'b'      :'>',
                  '>'      :'>',
@@ -200,7 +702,8 @@ _typesuffixes = {'float32':'f4',
 
 def rdmds(fnamearg,itrs=-1,machineformat='b',rec=None,fill_value=0,
           returnmeta=False,astype=float,region=None,lev=(),
-          usememmap=False,mm=False,squeeze=True,verbose=False):
+          usememmap=False,mm=False,squeeze=True,verbose=False,workers=None,
+          out=None,copy=True,nativecache=False):
     """
     Read meta-data files as written by MITgcm.
 
@@ -246,14 +749,39 @@ def rdmds(fnamearg,itrs=-1,machineformat='b',rec=None,fill_value=0,
         data type to return (default: double precision)
         None: keep data type/precision of file
     region : tuple of int
-        (x0,x1,y0,y1) read only this region (default (0,nx,0,ny))
+        (x0,x1,y0,y1) read only this region (default (0,nx,0,ny)); also
+        for exch2 files with map2glob (e.g. llc), where (nx,ny) is the shape
+        of the global file.  Tiles outside the region are not read, and
+        with usememmap only the rows in the region
     lev : list of int or tuple of lists of int
         list of levels to read, or, for multiple dimensions
         (excluding x,y), tuple(!) of lists (see examples below)
     usememmap : bool
-        if True, use a memory map for reading data (default False)
-        recommended when using lev, or region with global files
-        to save memory and, possibly, time
+        if True, use a memory map for reading data (default False).
+        Otherwise, whole files are read unless rec, lev or region are
+        given, in which case only the byte ranges of the records, levels
+        and rows needed are read
+    workers : int or None
+        number of threads used to read tile files concurrently
+        (default None: read tiles one after the other).  Useful for runs
+        with many tiles on file systems with a high per-file latency
+    out : array_like
+        C-contiguous array to read the data into, instead of allocating a new
+        one; must have the data type (astype) and size of the result
+    copy : bool
+        if False, return a read-only memory map of the data file instead of
+        a copy (default True).  Only possible for a single iteration of a
+        global file (or a single tile) without region or lev, with rec None
+        or an int, and with astype None or the data type of the file
+    nativecache : bool or string
+        if True or a directory name, read data from a native-endian copy of
+        each data file, which is written on first use and rewritten when the
+        data file is newer (default False).  Saves the byte swapping on every
+        read, in particular with copy=False.  The copies are kept outside the
+        run directory (which would invalidate the index of build_index and
+        the cached file lists), in the given directory or in
+        $XDG_CACHE_HOME/MITgcmutils/native (default ~/.cache/...), under the
+        absolute path of the data file
 
     Returns
     -------
@@ -279,9 +807,15 @@ def rdmds(fnamearg,itrs=-1,machineformat='b',rec=None,fill_value=0,
     >>> a = rdmds('diags',2880,rec=0,lev=([0],r_[:2,5:8]))  # same as previous
     >>> a = rdmds('diags',2880,rec=0)[0, [0,1,5,6,7], ...]  # same, but less efficient
     >>> a = rdmds('diags',2880)[0, 0, [0,1,5,6,7], ...]     # even less efficient
+    >>> T = rdmds('T',2880,workers=8)  # read tiles with 8 threads
+    >>> T = rdmds('T',5760,out=T)      # reuse array T for the next time step
+    >>> T = rdmds('T',2880,astype=None,copy=False)  # memory map, no copy
+    >>> T = rdmds('T',2880,astype=None,copy=False,nativecache=True)
+    >>> T = rdmds('T',2880,astype=None,copy=False,nativecache='/scratch/native')
     """
     import functools
     usememmap = usememmap or mm
+    nativedir = nativecache and _nativecachedir(nativecache)
     if usememmap:
         readdata = np.memmap
     else:
@@ -325,7 +859,8 @@ def rdmds(fnamearg,itrs=-1,machineformat='b',rec=None,fill_value=0,
         recsatonce = True
         readdata = np.memmap
     else:
-        recsatonce = allrec
+        # read whole files only if all of them is needed
+        recsatonce = allrec and nlev == 0 and region is None
         readdata = fromfileshape
 
     try:
@@ -337,133 +872,154 @@ def rdmds(fnamearg,itrs=-1,machineformat='b',rec=None,fill_value=0,
     metaref = {}
     timeStepNumbers = []
     timeIntervals = []
-    for iit,it in enumerate(itrs):
-        if additrs:
-            fname = fnamearg + '.{0:010d}'.format(int(it))
-        else:
-            fname = fnamearg
 
-        metafiles = glob.glob(fname + 2*('.'+3*'[0-9]') + '.meta') or glob.glob(fname+'.meta')
-        if len(metafiles) == 0:
-            raise IOError('No files found for ' + fname + '.meta')
-
-        if verbose: warning(metafiles[0])
-
-        if debug: warning('Found',len(metafiles),'metafiles for iteration',it)
-
-        for metafile in metafiles:
-            gdims,i0s,ies,timestep,timeinterval,map2gl,meta = readmeta(metafile)
-            if arr is None:
-                # initialize, allocate
-                try:
-                    dataprec, = meta['dataprec']
-                except KeyError:
-                    dataprec, = meta['format']
-                tp = typepre + _typesuffixes[dataprec]
-                size = np.dtype(tp).itemsize
-                if astype is None: astype = tp
-                recshape = tuple( ie-i0 for i0,ie in zip(i0s,ies) )
-                count = functools.reduce(mul, recshape)
-                nrecords, = meta['nrecords']
-                tileshape = (nrecords,) + recshape
-                if allrec:
-                    reclist = range(nrecords)
-                    recinds = np.s_[:,] + levinds
-                else:
-                    recinds = np.ix_(reclist, *levs)
+    def readtile(metafile, i0s, ies, map2gl, iit):
+        """ read one tile file and put it into its place in arr """
+        datafile = metafile[:-4] + 'data'
+        if tp != tpfile:
+            datafile = _nativedata(datafile, tpfile, tp, nativedir)
+
+        # where the x,y part of the tile goes in arr
+        pieces = tilepieces(i0s, ies, map2gl, gny, gnx)
+        if region is not None:
+            pieces = _clippieces(pieces, ri0, rie, rj0, rje)
+            if len(pieces) == 0:
+                # tile does not overlap region
+                return
+
+        # rows and columns of the tile that are needed
+        R0 = min(p[0] for p in pieces)
+        R1 = max(p[1] for p in pieces)
+        C0 = min(p[2] for p in pieces)
+        C1 = max(p[3] for p in pieces)
+        if debug: message(datafile, R0,R1,C0,C1)
+        xyinds = np.s_[...,R0:R1,C0:C1]
+
+        # part of arr that will receive tile (all records, all x,y)
+        sl = tuple( slice(i0,ie) for i0,ie in zip(i0s[:-2],ies[:-2]) )
+        arrtile = arr[(iit,slice(None))+sl]
+
+        def put(a, data):
+            for r0,r1,c0,c1,j0,js,i0 in pieces:
+                a[...,j0:j0+js*(r1-r0):js,i0:i0+c1-c0] = data[...,r0-R0:r1-R0,c0-C0:c1-C0]
+
+        if recsatonce:
+            put(arrtile, readdata(datafile, tp, shape=tileshape)[recinds + xyinds])
+        else:
+            # read only the byte ranges of the levels and rows needed
+            runs = _recordruns(recshape, levs, R0, R1)
+            buf = np.empty(sum(n for _,n in runs), tp)
+            bufshape = levdims + recshape[nlev:-2] + (R1-R0,recshape[-1])
+            with open(datafile, 'rb') as f:
+                for irec,recnum in enumerate(reclist):
+                    if recnum < 0: recnum += nrecords
+                    i = 0
+                    for off,n in runs:
+                        f.seek((recnum*count + off)*size)
+                        if f.readinto(buf[i:i+n]) != n*size:
+                            raise IOError('Unexpected end of file ' + datafile)
+                        i += n
+                    put(arrtile[irec], buf.reshape(bufshape)[...,C0:C1])
+
+    if workers is not None and workers > 1:
+        # np.fromfile and friends release the GIL, so threads are good enough
+        # to overlap the per-file latency of (parallel) file systems
+        from concurrent.futures import ThreadPoolExecutor
+        pool = ThreadPoolExecutor(workers)
+        mapper = pool.map
+    else:
+        pool = None
+        mapper = map
 
-                if region is None:
-                    ri0,rie,rj0,rje = 0,gdims[-1],0,gdims[-2]
-                else:
-                    ri0,rie,rj0,rje = region
-                    if ri0 < 0: ri0 += gdims[-1]
-                    if rie < 0: rie += gdims[-1]
-                    if rj0 < 0: rj0 += gdims[-2]
-                    if rje < 0: rje += gdims[-2]
-
-                assert nlev+2 <= len(gdims)
-                rdims = levdims + gdims[len(levdims):-2] + (rje-rj0,rie-ri0)
-                # always include itrs and rec dimensions and squeeze later
-                arr = np.empty((len(itrs),len(reclist))+rdims, astype)
-                arr[...] = fill_value
-                metaref = meta
+    try:
+        for iit,it in enumerate(itrs):
+            if additrs:
+                fname = fnamearg + '.{0:010d}'.format(int(it))
             else:
-                if meta != metaref:
-                    raise ValueError('Meta files not compatible')
-
-            datafile = metafile[:-4] + 'data'
-
-            if region is not None:
-                if map2gl is None:
-                    # overlap of tile with region:
-                    i0 = min(rie, max(ri0, i0s[-1]))
-                    ie = min(rie, max(ri0, ies[-1]))
-                    j0 = min(rje, max(rj0, i0s[-2]))
-                    je = min(rje, max(rj0, ies[-2]))
-                    # source indices
-                    I0 = i0 - i0s[-1]
-                    Ie = ie - i0s[-1]
-                    J0 = j0 - i0s[-2]
-                    Je = je - i0s[-2]
-                    # target indices
-                    i0s[-1] = i0 - ri0
-                    ies[-1] = ie - ri0
-                    i0s[-2] = j0 - rj0
-                    ies[-2] = je - rj0
-                else:
-                    raise NotImplementedError('Region selection is not implemented for map2glob != [0,1]')
+                fname = fnamearg
+
+            metafiles,metainfos = findmeta(fname, mapper)
+            if len(metafiles) == 0:
+                raise IOError('No files found for ' + fname + '.meta')
+
+            if verbose: warning(metafiles[0])
+
+            if debug: warning('Found',len(metafiles),'metafiles for iteration',it)
+
+            tiles = []
+            for metafile,metainfo in zip(metafiles, metainfos):
+                gdims,i0s,ies,timestep,timeinterval,map2gl,meta = metainfo
+                if arr is None:
+                    # initialize, allocate
+                    try:
+                        dataprec, = meta['dataprec']
+                    except KeyError:
+                        dataprec, = meta['format']
+                    tpfile = typepre + _typesuffixes[dataprec]
+                    tp = tpfile
+                    if nativecache:
+                        tp = np.dtype(tpfile).newbyteorder('=').str
+                    size = np.dtype(tp).itemsize
+                    if astype is None: astype = tp
+                    recshape = tuple( ie-i0 for i0,ie in zip(i0s,ies) )
+                    count = functools.reduce(mul, recshape)
+                    nrecords, = meta['nrecords']
+                    tileshape = (nrecords,) + recshape
+                    if allrec:
+                        reclist = range(nrecords)
+                        recinds = np.s_[:,] + levinds
+                    else:
+                        recinds = np.ix_(reclist, *levs)
 
-            sl = tuple( slice(i0,ie) for i0,ie in zip(i0s,ies) )
-            if map2gl is None:
-                # part of arr that will receive tile (all records)
-                arrtile = arr[(iit,slice(None))+sl]
-            else:
-                ny,nx = arr.shape[-2:]
-                i0 = i0s[-1]
-                j0 = i0s[-2]
-                ie = ies[-1]
-                je = ies[-2]
-                # "flat" stride for j
-                jstride = map2gl[1]*nx + map2gl[0]
-                n = (je-j0)*jstride
-                # start of a jstride by je-j0 block that contains this tile
-                ii0 = min(i0+nx*j0, nx*ny-n)
-                # tile starts at ioff+i0
-                ioff = nx*j0 - ii0
-                # flatten x,y dimensions
-                arrflat = arr.reshape(arr.shape[:-2]+(nx*ny,))
-                # extract tile
-                arrmap = arrflat[...,ii0:ii0+n].reshape(arr.shape[:-2]+(je-j0,jstride))[...,:,ioff+i0:ioff+ie]
-                # slice non-x,y dimensions (except records)
-                arrtile = arrmap[(iit,slice(None))+sl[:-2]]
-                del arrflat,arrmap
-
-            if recsatonce:
-                if region is None:
-                    arrtile[...] = readdata(datafile, tp, shape=tileshape)[recinds]
-                else:
-                    if Ie > I0 and Je > J0:
-                        if debug: message(datafile, I0,Ie,J0,Je)
-                        arrtile[...] = readdata(datafile, tp, shape=tileshape)[recinds + np.s_[...,J0:Je,I0:Ie]]
-            else:
-                f = open(datafile)
-                for irec,recnum in enumerate(reclist):
-                    if recnum < 0: recnum += nrecords
-                    f.seek(recnum*count*size)
+                    gny,gnx = gdims[-2:]
                     if region is None:
-                        arrtile[irec] = np.fromfile(f, tp, count=count).reshape(recshape)[levinds]
+                        ri0,rie,rj0,rje = 0,gdims[-1],0,gdims[-2]
                     else:
-                        if Ie > I0 and Je > J0:
-                            if debug: message(datafile, I0,Ie,J0,Je)
-                            tilerec = np.fromfile(f, tp, count=count).reshape(recshape)
-                            arrtile[irec] = tilerec[levinds + np.s_[...,J0:Je,I0:Ie]]
-                f.close()
+                        ri0,rie,rj0,rje = region
+                        if ri0 < 0: ri0 += gdims[-1]
+                        if rie < 0: rie += gdims[-1]
+                        if rj0 < 0: rj0 += gdims[-2]
+                        if rje < 0: rje += gdims[-2]
+
+                    assert nlev+2 <= len(gdims)
+                    rdims = levdims + gdims[len(levdims):-2] + (rje-rj0,rie-ri0)
+                    # always include itrs and rec dimensions and squeeze later
+                    shape = (len(itrs),len(reclist))+rdims
+                    if not copy:
+                        arr = _mapglobal(metafile[:-4] + 'data', tpfile, tp,
+                                         shape, tileshape, rec, astype,
+                                         len(metafiles), region, nlev, out,
+                                         nativedir)
+                    else:
+                        if out is None:
+                            arr = np.empty(shape, astype)
+                        else:
+                            if out.dtype != np.dtype(astype):
+                                raise ValueError('out has type {} instead of {}'.format(out.dtype, np.dtype(astype)))
+                            if not out.flags.c_contiguous:
+                                raise ValueError('out must be C-contiguous')
+                            arr = out.reshape(shape)
+                        arr[...] = fill_value
+                    metaref = meta
+                else:
+                    if meta != metaref:
+                        raise ValueError('Meta files not compatible')
+
+                if copy:
+                    tiles.append((metafile, i0s, ies, map2gl, iit))
 
-        if timestep is not None:
-            timeStepNumbers.extend(timestep)
+            # tiles write to disjoint parts of arr, so they can be read in any order
+            for _ in mapper(lambda args: readtile(*args), tiles):
+                pass
 
-        if timeinterval is not None:
-            timeIntervals.append(timeinterval)
+            if timestep is not None:
+                timeStepNumbers.extend(timestep)
+
+            if timeinterval is not None:
+                timeIntervals.append(timeinterval)
+    finally:
+        if pool is not None:
+            pool.shutdown()
 
     # put list of iteration numbers back into metadata dictionary
     if len(timeStepNumbers):
@@ -496,9 +1052,143 @@ def rdmds(fnamearg,itrs=-1,machineformat='b',rec=None,fill_value=0,
         return arr
 
 
+def _mapglobal(datafile, tpfile, tp, shape, tileshape, rec, astype, ntiles,
+               region, nlev, out, nativedir):
+    """ return a read-only memory map of datafile with shape (1,nrec,...) for
+        rdmds(..., copy=False), or raise ValueError if that is not possible """
+    if shape[0] != 1:
+        raise ValueError('copy=False requires a single iteration')
+    if region is not None or nlev:
+        raise ValueError('copy=False does not support region or lev')
+    if ntiles != 1 or shape[2:] != tileshape[1:]:
+        raise ValueError('copy=False requires a global file')
+    if rec is not None and np.iterable(rec):
+        raise ValueError('copy=False requires rec to be None or an int')
+    if np.dtype(astype) != np.dtype(tp):
+        raise ValueError('copy=False requires astype=None or {}'.format(np.dtype(tp)))
+    if out is not None:
+        raise ValueError('copy=False cannot be used with out')
+    if tp != tpfile:
+        datafile = _nativedata(datafile, tpfile, tp, nativedir)
+    arr = np.memmap(datafile, tp, mode='r', shape=tileshape)
+    if rec is not None:
+        nrecords = tileshape[0]
+        if not -nrecords <= rec < nrecords:
+            raise IndexError('record {} out of range'.format(rec))
+        rec %= nrecords
+        arr = arr[rec:rec+1]
+    return arr[np.newaxis]
+
+
+_nativelock = threading.Lock()
+
+def _nativecachedir(nativecache):
+    """ directory for the native-endian copies of rdmds(..., nativecache) """
+    if nativecache is True:
+        cachehome = (os.environ.get('XDG_CACHE_HOME')
+                     or os.path.join(os.path.expanduser('~'), '.cache'))
+        return os.path.join(cachehome, 'MITgcmutils', 'native')
+    return nativecache
+
+
+def _nativedata(datafile, tpfile, tp, nativedir):
+    """ return the name of a copy of datafile converted from type tpfile to
+        (native-endian) type tp, <nativedir>/<abspath of fname>.native.data,
+        writing it if it does not exist or is older than datafile """
+    if np.dtype(tp) == np.dtype(tpfile):
+        return datafile
+    path = os.path.splitdrive(os.path.abspath(datafile))[1].lstrip(os.sep)
+    nativefile = os.path.join(nativedir, path[:-5] + '.native.data')
+    stat = os.stat(datafile)
+    with _nativelock:
+        os.makedirs(os.path.dirname(nativefile), exist_ok=True)
+        try:
+            nstat = os.stat(nativefile)
+        except OSError:
+            nstat = None
+        if (nstat is None or nstat.st_size != stat.st_size
+                or nstat.st_mtime < stat.st_mtime):
+            # write to a temporary file first so that other processes never
+            # see an incomplete copy
+            tmpfile = '{}.{}.tmp'.format(nativefile, os.getpid())
+            src = np.memmap(datafile, tpfile, mode='r')
+            try:
+                with open(tmpfile, 'wb') as f:
+                    _writechunked(f, src, tp)
+            finally:
+                del src
+            os.rename(tmpfile, nativefile)
+    return nativefile
+
+
+def iter_mds(fname, itrs=np.nan, readahead=False, **kwargs):
+    """
+    Iterate over the iterations of an mds data set, one at a time.
+
+    Generator yielding (itr, a, meta) for each iteration number itr, where a
+    and meta are as returned by rdmds(fname, itr, returnmeta=True, ...).  All
+    iterations are read into the same array, so a is overwritten by the next
+    iteration: copy it if you need to keep it.  Memory use is thus independent
+    of the number of iterations.
+
+    Parameters
+    ----------
+    fname : string
+        name of file to read, without the iteration number and suffixes
+    itrs : list of ints or np.nan
+        iteration numbers (default np.nan: all iterations found)
+    readahead : bool
+        if True, read the next iteration in a background thread while the
+        caller works on the current one.  This uses a second array.
+    **kwargs
+        further arguments for rdmds (rec, lev, region, astype, workers, ...)
+
+    Examples
+    --------
+    >>> n = 0
+    >>> for it,T,meta in iter_mds('T', readahead=True):
+    ...     Tsum = T.copy() if n == 0 else Tsum + T
+    ...     n += 1
+    >>> Tmean = Tsum/n
+    """
+    if itrs is np.nan:
+        itrs = scanforfiles(fname)
+    elif itrs is np.inf:
+        itrs = scanforfiles(fname)[-1:]
+    itrs = _aslist(itrs)
+    kwargs['returnmeta'] = True
+    kwargs.pop('out', None)
+
+    if len(itrs) == 0:
+        return
+
+    a,_,meta = rdmds(fname, itrs[0], **kwargs)
+    if not readahead:
+        for i,it in enumerate(itrs):
+            if i > 0:
+                a,_,meta = rdmds(fname, it, out=a, **kwargs)
+            yield it, a, meta
+        return
+
+    from concurrent.futures import ThreadPoolExecutor
+    pool = ThreadPoolExecutor(1)
+    try:
+        b = np.empty_like(a)
+        for i,it in enumerate(itrs):
+            if i > 0:
+                a,_,meta = future.result()
+            if i + 1 < len(itrs):
+                # a is free again once we get here; fill b meanwhile
+                future = pool.submit(rdmds, fname, itrs[i+1], out=b, **kwargs)
+            yield it, a, meta
+            a,b = b,a
+    finally:
+        pool.shutdown()
+
+
 def wrmds(fbase, arr, itr=None, dataprec='float32', ndims=None, nrecords=None,
           times=None, fields=None, simulation=None, machineformat='b',
-          deltat=None, dimlist=None):
+          deltat=None, dimlist=None, tiles=None, workers=None):
     '''Write an array to an mds meta/data file set.
 
     If itr is given, the files will be named fbase.0000000itr.data and
@@ -536,6 +1226,22 @@ def wrmds(fbase, arr, itr=None, dataprec='float32', ndims=None, nrecords=None,
     dimlist : tuple
         dimensions as will be stored in file (only useful when passing
         meta data from an existing file to wrmds as keyword args)
+    tiles : tuple of int
+        (sNx, sNy): write one meta/data file pair per tile of this size,
+        named fbase.0000000itr.001.001.data, ..., as MITgcm does with
+        globalFiles=.FALSE.  The last two dimensions of arr are y and x.
+    workers : int
+        number of threads for writing tile files (default: one at a time)
+
+    Notes
+    -----
+    Data are converted to the file's type and byte order in chunks, so only
+    a small part of the array is copied at any time.
+
+    Examples
+    --------
+    >>> wrmds('T', T, itr=0, fields=['THETA'])
+    >>> wrmds('pickup', p, itr=72000, dataprec='float64', tiles=(90, 90), workers=8)
     '''
     if type(dataprec) == type([]): dataprec, = dataprec
     if type(ndims) == type([]): ndims, = ndims
@@ -592,46 +1298,389 @@ def wrmds(fbase, arr, itr=None, dataprec='float32', ndims=None, nrecords=None,
     if itr is not None:
         fbase = fbase + '.{:010d}'.format(itr)
 
-    with open(fbase + '.meta', 'w') as f:
-        if simulation is not None:
-            f.write(" simulation = { '" + simulation + "' };\n")
+    if tiles is not None:
+        if ndims < 2:
+            raise ValueError('Need at least 2 dimensions for tiles')
+        sNx,sNy = tiles
+        nx,ny = dims[:2]
+        if nx % sNx or ny % sNy:
+            raise ValueError('Tile size {} does not divide {}'.format(tiles, (nx,ny)))
+
+    # meta file contents before and after dimList
+    metahead = ''
+    if simulation is not None:
+        metahead += " simulation = { '" + simulation + "' };\n"
+
+    metahead += " nDims = [ {:3d} ];\n".format(ndims)
+
+    if max(dims) < 10000:
+        fmt = '{:5d}'
+    else:
+        fmt = '{:10d}'
+
+    fmt = fmt + ',' + fmt + ',' + fmt
+
+    # skipping m2gl
 
-        f.write(" nDims = [ {:3d} ];\n".format(ndims))
+    metatail = " dataprec = [ '" + dataprec + "' ];\n"
 
-        if max(dims) < 10000:
-            fmt = '{:5d}'
+    metatail += " nrecords = [ {:5d} ];\n".format(nrec)
+
+    if itr is not None:
+        metatail += " timeStepNumber = [ {:10d} ];\n".format(itr)
+
+    if times is not None:
+        metatail += (" timeInterval = [" +
+                     "".join("{:20.12E}".format(t) for t in times) +
+                     " ];\n")
+
+    if fields is not None:
+        nflds = len(fields)
+        metatail += " nFlds = [ {:4d} ];\n".format(nflds)
+        metatail += " fldList = {\n"
+        for row in range((nflds+19)//20):
+            for field in fields[20*row:20*(row+1)]:
+                metatail += " '{:<8s}'".format(field)
+            metatail += "\n"
+        metatail += " };\n"
+
+    def writefiles(fname, i0s, ies, sl):
+        """ write meta/data file pair for part sl of arr """
+        with open(fname + '.meta', 'w') as f:
+            f.write(metahead)
+            f.write(" dimList = [\n " +
+                ",\n ".join(fmt.format(d,i0+1,ie) for d,i0,ie in zip(dims,i0s,ies)) +
+                "\n ];\n")
+            f.write(metatail)
+
+        with open(fname + '.data', 'wb') as f:
+            _writechunked(f, arr[sl], tp)
+
+    if tiles is None:
+        writefiles(fbase, len(dims)*[0], dims, Ellipsis)
+    else:
+        args = []
+        for bj in range(ny//sNy):
+            for bi in range(nx//sNx):
+                i0s = [bi*sNx, bj*sNy] + (len(dims)-2)*[0]
+                ies = [(bi+1)*sNx, (bj+1)*sNy] + list(dims[2:])
+                sl = np.s_[...,bj*sNy:(bj+1)*sNy,bi*sNx:(bi+1)*sNx]
+                fname = fbase + '.{:03d}.{:03d}'.format(bi+1, bj+1)
+                args.append((fname, i0s, ies, sl))
+
+        if workers is not None and workers > 1:
+            from concurrent.futures import ThreadPoolExecutor
+            with ThreadPoolExecutor(workers) as pool:
+                for _ in pool.map(lambda a: writefiles(*a), args):
+                    pass
         else:
-            fmt = '{:10d}'
+            for a in args:
+                writefiles(*a)
+
+
+# number of elements converted at a time when writing
+_chunksize = 1 << 22
+
+def _writechunked(f, a, tp, chunksize=_chunksize):
+    """ write array a to file f as type tp in C order, converting at most
+        chunksize elements at a time """
+    tp = np.dtype(tp)
+    if a.dtype == tp and a.flags.c_contiguous:
+        a.tofile(f)
+    elif a.size <= chunksize:
+        a.astype(tp).tofile(f)
+    elif a.ndim == 1 or a.flags.c_contiguous:
+        a = a.reshape(-1)
+        for i in range(0, a.size, chunksize):
+            a[i:i+chunksize].astype(tp).tofile(f)
+    else:
+        for sub in a:
+            _writechunked(f, sub, tp, chunksize)
 
-        fmt = fmt + ',' + fmt + ',' + fmt
 
-        f.write(" dimList = [\n " +
-            ",\n ".join(fmt.format(d,1,d) for d in dims) +
-            "\n ];\n")
+_pwritelock = threading.Lock()
+
+def _pwrite(fd, data, offset):
+    """ write all of data at offset in file descriptor fd, without moving
+        the file position where os.pwrite is available """
+    data = memoryview(data).cast('B')
+    while len(data):
+        if hasattr(os, 'pwrite'):
+            n = os.pwrite(fd, data, offset)
+        else:
+            with _pwritelock:
+                os.lseek(fd, offset, os.SEEK_SET)
+                n = os.write(fd, data)
+        data = data[n:]
+        offset += n
+
+
+def _indexarray(ind, n):
+    """ convert an index for a dimension of length n into an array of indices;
+        also return whether the dimension is kept """
+    if isinstance(ind, slice):
+        return np.arange(*ind.indices(n)), True
+    elif np.iterable(ind):
+        res = np.asarray(ind, dtype=int).ravel()
+        if np.any(res >= n) or np.any(res < -n):
+            raise IndexError('index out of bounds for dimension of size {}'.format(n))
+        return np.where(res < 0, res + n, res), True
+    else:
+        i = int(ind)
+        if i < 0: i += n
+        if not 0 <= i < n:
+            raise IndexError('index {} is out of bounds for dimension of size {}'.format(ind, n))
+        return np.array([i]), False
 
-        # skipping m2gl
 
-        f.write(" dataprec = [ '" + dataprec + "' ];\n")
+def _select(inds, i0, ie, step=1):
+    """ find which of the global indices inds fall into range(i0,ie,step);
+        return their positions and offsets relative to i0 in units of step """
+    off = inds - i0
+    mask = (off >= 0) & (inds < ie)
+    if step != 1:
+        mask &= off % step == 0
+    pos, = np.nonzero(mask)
+    return pos, off[pos]//step
 
-        f.write(" nrecords = [ {:5d} ];\n".format(nrec))
 
-        if itr is not None:
-            f.write(" timeStepNumber = [ {:10d} ];\n".format(itr))
+class MDSArray(object):
+    """
+    A lazy array for an mds data set as written by MITgcm.
 
-        if times is not None:
-            f.write(" timeInterval = [" +
-                    "".join("{:20.12E}".format(t) for t in times) +
-                    " ];\n")
+    Only the shape, data type and tile layout are read when the object is
+    created.  Indexing it reads only the tiles, records and levels needed for
+    the requested part of the array, using memory maps of the tile files.
+    The object can be wrapped by dask:
 
-        if fields is not None:
-            nflds = len(fields)
-            f.write(" nFlds = [ {:4d} ];\n".format(nflds))
-            f.write(" fldList = {\n")
-            for row in range((nflds+19)//20):
-                for field in fields[20*row:20*(row+1)]:
-                    f.write(" '{:<8s}'".format(field))
-                f.write("\n")
-            f.write(" };\n")
+    >>> import dask.array as da
+    >>> T = da.from_array(open_mds('T', np.nan))
 
-    arr.astype(tp).tofile(fbase + '.data')
+    Dimensions are (iterations, records, ..., y, x).  The iteration dimension
+    is present only if itrs is a list (or np.nan), the record dimension only if
+    the files contain more than one record.  All iterations are assumed to have
+    the same tile layout as the first one.  Lists of indices select along
+    each dimension independently (like lev in rdmds), unlike numpy's fancy
+    indexing.
 
+    Parameters
+    ----------
+    fname : string
+        name of file to read, without the iteration number and suffixes;
+        may contain shell wildcards as for rdmds
+    itrs : int or list of ints or np.nan or np.inf
+        iteration number(s), as for rdmds
+    machineformat : string
+        endianness ('b' or 'l', default 'b')
+    fill_value : float
+        fill value for missing (blank) tiles (default 0)
+    astype : data type
+        data type to return (default: double precision)
+        None: keep data type/precision of file
+
+    Attributes
+    ----------
+    shape, dtype, ndim, size
+        as for numpy arrays
+    chunks : tuple of int
+        natural chunk sizes (one iteration and record, one tile in x and y)
+    itrs : list of int
+        iteration numbers along the iteration dimension
+    meta : dict
+        meta data of the first tile (with lower-case keys)
+    """
+    def __init__(self, fname, itrs=-1, machineformat='b', fill_value=0,
+                 astype=float):
+        self._fname = fname
+        self._additrs = itrs != -1
+        if itrs is np.nan:
+            itrs = scanforfiles(fname)
+            itrsislist = True
+        elif itrs is np.inf:
+            itrs = scanforfiles(fname)[-1:]
+            itrsislist = False
+        else:
+            itrsislist = np.iterable(itrs)
+        self.itrs = _aslist(itrs)
+        if len(self.itrs) == 0:
+            raise IOError('No files found for ' + fname)
+
+        try:
+            typepre = _typeprefixes[machineformat]
+        except KeyError:
+            raise ValueError('Allowed machineformats: ' + ' '.join(_typeprefixes))
+
+        fname0 = self._filename(self.itrs[0])
+        metafiles,metainfos = findmeta(fname0)
+        if len(metafiles) == 0:
+            raise IOError('No files found for ' + fname0 + '.meta')
+
+        # tile layout: file name suffix and position of each tile
+        self._tiles = []
+        metaref = None
+        for metafile,metainfo in sorted(zip(metafiles, metainfos)):
+            gdims,i0s,ies,timestep,timeinterval,map2gl,meta = metainfo
+            if metaref is None:
+                metaref = meta
+            elif meta != metaref:
+                raise ValueError('Meta files not compatible')
+            suffix = metafile[len(fname0):-5]
+            recshape = tuple( ie-i0 for i0,ie in zip(i0s,ies) )
+            pieces = tilepieces(i0s, ies, map2gl, gdims[-2], gdims[-1])
+            self._tiles.append((suffix, i0s[:-2], recshape, pieces))
+
+        try:
+            dataprec, = metaref['dataprec']
+        except KeyError:
+            dataprec, = metaref['format']
+        self._tp = typepre + _typesuffixes[dataprec]
+        self.dtype = np.dtype(astype or self._tp)
+        self.fill_value = fill_value
+        self._nrec, = metaref['nrecords']
+        self._gdims = gdims
+        self.meta = dict((k.lower(),v) for k,v in metaref.items())
+        self.meta['timestepnumber'] = self.itrs
+
+        # the full index space always has iteration and record dimensions,
+        # _keep tells which ones are visible
+        self._fullshape = (len(self.itrs), self._nrec) + gdims
+        self._keep = (itrsislist, self._nrec > 1) + len(gdims)*(True,)
+        self.shape = tuple( n for n,k in zip(self._fullshape, self._keep) if k )
+
+        tilerecshape = self._tiles[0][2]
+        if map2gl is None:
+            chunks = (1, 1) + gdims[:-2] + tilerecshape[-2:]
+        else:
+            chunks = (1, 1) + gdims[:-2] + (tilerecshape[-2], gdims[-1])
+        self.chunks = tuple( c for c,k in zip(chunks, self._keep) if k )
+
+    def _filename(self, it):
+        if self._additrs:
+            return self._fname + '.{0:010d}'.format(int(it))
+        else:
+            return self._fname
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    @property
+    def size(self):
+        return functools.reduce(mul, self.shape, 1)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __repr__(self):
+        return 'MDSArray({!r}, shape={}, dtype={})'.format(self._fname, self.shape, self.dtype)
+
+    def __array__(self, dtype=None, copy=None):
+        a = self[...]
+        if dtype is not None:
+            a = a.astype(dtype, copy=False)
+        return a
+
+    def _fullindex(self, ind):
+        """ expand ind to one index per dimension of the full index space """
+        if not isinstance(ind, tuple):
+            ind = (ind,)
+        if any( i is None for i in ind ):
+            raise IndexError('MDSArray does not support np.newaxis')
+        nell = sum( i is Ellipsis for i in ind )
+        if nell > 1:
+            raise IndexError('an index can only have a single ellipsis')
+        if nell:
+            cut = ind.index(Ellipsis)
+            nfill = self.ndim - len(ind) + 1
+            ind = ind[:cut] + nfill*(slice(None),) + ind[cut+1:]
+        if len(ind) > self.ndim:
+            raise IndexError('too many indices for array')
+        ind = ind + (self.ndim - len(ind))*(slice(None),)
+        full = []
+        it = iter(ind)
+        for keep in self._keep:
+            full.append(next(it) if keep else 0)
+        return full
+
+    def __getitem__(self, ind):
+        full = self._fullindex(ind)
+        inds = []
+        keep = []
+        for i,n,k in zip(full, self._fullshape, self._keep):
+            a,kept = _indexarray(i, n)
+            inds.append(a)
+            keep.append(k and kept)
+        itinds,recs = inds[:2]
+        levinds = inds[2:-2]
+        yinds,xinds = inds[-2:]
+
+        res = np.empty(tuple(len(a) for a in inds), self.dtype)
+        res[...] = self.fill_value
+
+        if res.size:
+            for iit,it in enumerate(itinds):
+                fname = self._filename(self.itrs[it])
+                for suffix,i0s,recshape,pieces in self._tiles:
+                    # overlap in non-x,y dimensions
+                    sel = [ _select(a, i0, i0+n)
+                            for a,i0,n in zip(levinds, i0s, recshape[:-2]) ]
+                    if any( len(pos) == 0 for pos,_ in sel ):
+                        continue
+                    mm = None
+                    for r0,r1,c0,c1,j0,js,i0 in pieces:
+                        jpos,rows = _select(yinds, j0, j0+js*(r1-r0), js)
+                        ipos,cols = _select(xinds, i0, i0+c1-c0)
+                        if len(jpos) == 0 or len(ipos) == 0:
+                            continue
+                        if mm is None:
+                            datafile = fname + suffix + '.data'
+                            mm = np.memmap(datafile, self._tp, 'r',
+                                           shape=(self._nrec,)+recshape)
+                        src = [recs] + [off for _,off in sel] + [rows + r0, cols + c0]
+                        dst = [[iit], np.arange(len(recs))] + [pos for pos,_ in sel] + [jpos, ipos]
+                        # restrict memory map to bounding box before indexing
+                        box = tuple( slice(a.min(), a.max()+1) for a in src )
+                        src = [ a - a.min() for a in src ]
+                        res[np.ix_(*dst)] = mm[box][np.ix_(*src)]
+                    del mm
+
+        return res.reshape(tuple( len(a) for a,k in zip(inds, keep) if k ))
+
+
+def open_mds(fname, itrs=-1, machineformat='b', fill_value=0, astype=float):
+    """
+    Open an mds data set as a lazy array.
+
+    Nothing but the meta files of the first iteration is read until the
+    array is indexed, so this also works for data sets that are much larger
+    than memory.  See MDSArray for details.
+
+    Parameters
+    ----------
+    fname : string
+        name of file to read, without the iteration number and suffixes
+    itrs : int or list of ints or np.nan or np.inf
+        iteration number(s), as for rdmds
+    machineformat : string
+        endianness ('b' or 'l', default 'b')
+    fill_value : float
+        fill value for missing (blank) tiles (default 0)
+    astype : data type
+        data type to return (default: double precision)
+        None: keep data type/precision of file
+
+    Returns
+    -------
+    a : MDSArray
+        lazy array with attributes shape, dtype and chunks
+
+    Examples
+    --------
+    >>> T = open_mds('T', numpy.nan)
+    >>> T.shape
+    (73, 50, 1170, 90)
+    >>> sst = T[:, 0]                 # reads only the top level
+    >>> import dask.array as da
+    >>> Tmean = da.from_array(T).mean(axis=0).compute()
+    """
+    return MDSArray(fname, itrs, machineformat, fill_value, astype)
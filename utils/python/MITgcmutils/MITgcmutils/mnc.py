@@ -1,7 +1,14 @@
+import os
+import re
 import sys
 import glob
+import threading
+import warnings
+from collections import OrderedDict
+from contextlib import contextmanager
 import numpy as np
-from .netcdf import netcdf_file
+from .netcdf import netcdf_file, _indexkey
+from ._cache import _LRUCache
 
 _exclude_global = ['close',
                    'createDimension',
@@ -36,6 +43,86 @@ def getattributes(nc, exclude=[]):
     return a
 
 
+# headers of tile files, keyed by (path, mtime, size)
+_headercache = _LRUCache(65536)
+
+# file names written by mnc: prefix.<iteration>.t<tile>.nc
+_mncname_pattern = re.compile(r'^(.*)\.([0-9]{10})\.t([0-9]+)\.nc$')
+
+def _splitmncname(fname):
+    """ return (directory, prefix, iteration, tile) of an mnc file name
+        prefix.<iteration>.t<tile>.nc, or None if it is not of this form """
+    dirname,name = os.path.split(fname)
+    m = _mncname_pattern.match(name)
+    if m is None:
+        return None
+    prefix,itr,tile = m.groups()
+    return dirname, prefix, int(itr), int(tile)
+
+def _readheader(fname):
+    """ return the header of netcdf file fname (a netcdf_file without data);
+        cached as long as the file is not modified """
+    st = os.stat(fname)
+    key = (os.path.abspath(fname), st.st_mtime_ns, st.st_size)
+    header = _headercache.get(key)
+    if header is None:
+        header = netcdf_file(fname, 'r', header_only=True)
+        _headercache.set(key, header)
+    return header
+
+
+class _FilePool(object):
+    """ a thread-safe pool of open netcdf files that closes the least
+        recently used ones when more than maxopen are open and not in use """
+    def __init__(self, maxopen):
+        self.maxopen = maxopen
+        self._files = OrderedDict()
+        self._users = {}
+        self._lock = threading.Lock()
+
+    def pin(self, fname):
+        """ open fname and keep it open until release or close """
+        with self._lock:
+            nc = self._files.pop(fname, None)
+            if nc is None:
+                nc = netcdf_file(fname, 'r')
+            self._files[fname] = nc
+            self._users[fname] = self._users.get(fname, 0) + 1
+            self._evict()
+        return nc
+
+    @contextmanager
+    def open(self, fname):
+        nc = self.pin(fname)
+        try:
+            yield nc
+        finally:
+            with self._lock:
+                self._users[fname] -= 1
+                self._evict()
+
+    def _evict(self):
+        # data of a file in use must not be unmapped, so skip those
+        excess = len(self._files) - self.maxopen
+        for fname in list(self._files):
+            if excess <= 0:
+                break
+            if not self._users.get(fname):
+                self._files.pop(fname).close()
+                self._users.pop(fname, None)
+                excess -= 1
+
+    def __len__(self):
+        return len(self._files)
+
+    def close(self):
+        with self._lock:
+            while self._files:
+                fname,nc = self._files.popitem(last=False)
+                nc.close()
+            self._users.clear()
+
+
 class MNC:
     """
     A file object for MNC (tiled NetCDF) data.
@@ -44,8 +131,25 @@ class MNC:
 
     Parameters
     ----------
-    fpatt : string
-        glob pattern for tile files
+    fpatt : string or list of strings
+        glob pattern for tile files, or list of tile file names
+    multitime : bool
+        if True, `fpatt` may match files split in time,
+        prefix.<iteration>.t<tile>.nc.  Records of record variables are
+        concatenated across the iterations in the file names.  Files are
+        only opened when their records are read.  All file names must be
+        of this form, and each iteration must have the same tiles.
+    workers : int or None
+        number of threads used to copy tiles into the global array
+        (default None: one tile after the other)
+    maxopen : int
+        maximum number of tile files kept open (default 128).  Files are
+        opened when data is read from them; headers are read only once.
+    cache : int
+        number of recently read slices (basic indices only) whose
+        assembled arrays are kept and returned again, read-only, when the
+        same slice is requested (default 0).  Assembled arrays are always
+        native-endian.
     layout : string
         which global layout to use:
 
@@ -67,31 +171,55 @@ class MNC:
     temp and salt are now assembled (global) arrays of shape (Nt, Nr, Ny, Nx)
     where Nt is the number iterations found in the file (in this case probably 1).
 
-    Notes
-    -----
-    The multitime option is not implemented, i.e., MNC cannot read files split
-    in time.
+    >>> nc = mnc_files('mnc_*/state.*.t*.nc', multitime=True)
+    >>> temp = nc.variables['Temp'][-10:]
+    reads the last 10 records, opening only the files that contain them.
     """
 
     # avoid problems with __del__
-    nc = []
-
-    def __init__(self, fpatt, layout=None, multitime=False):
-        fnames = glob.glob(fpatt)
-#        if multitime:
-#            iters = [ f[-18:-8] for f in fnames if f.endswith('.t001.nc') ]
-#            iters.sort()
-#            fnames_first = [ f for f in fnames if f[-18:-8] == iters[0] ]
-#        else:
-#            fnames_first = fnames
-        fnames.sort()
+    _pool = None
+    _nc = None
+
+    def __init__(self, fpatt, layout=None, multitime=False, workers=None,
+                 maxopen=128, cache=0):
+        self._workers = workers
+        self._cache = _LRUCache(cache) if cache else None
+        self._pool = _FilePool(maxopen)
+        if isinstance(fpatt, str):
+            fnames = glob.glob(fpatt)
+        else:
+            fnames = list(fpatt)
+        if multitime:
+            # group files by iteration, prefix.<iteration>.t<tile>.nc,
+            # with tiles in the same order in each group
+            groups = {}
+            tilekeys = {}
+            for f in fnames:
+                parts = _splitmncname(f)
+                if parts is None:
+                    raise ValueError('multitime needs file names '
+                                     'prefix.<iteration>.t<tile>.nc: ' + f)
+                dirname,prefix,itr,tile = parts
+                groups.setdefault(itr, []).append(f)
+                tilekeys[f] = (dirname, prefix, tile)
+            tilekey = tilekeys.get
+            self._fnames = [ sorted(groups[it], key=tilekey) for it in sorted(groups) ]
+            tiles = [ tilekey(f) for f in self._fnames[0] ]
+            for fnames in self._fnames[1:]:
+                if [ tilekey(f) for f in fnames ] != tiles:
+                    raise ValueError('Tile files do not match: ' + fnames[0])
+        else:
+            fnames.sort()
+            self._fnames = [fnames]
 
-        # open files
-        self.nc = [ netcdf_file(f,'r') for f in fnames ]
+        # read headers of first group; files are opened when needed
+        headers = [ _readheader(f) for f in self._fnames[0] ]
+        tileattrs = [ getattributes(h, _exclude_global) for h in headers ]
+        self._ntiles = len(headers)
 
         # global attributes
         # get from first file, but remove/reset tile-specific ones
-        self._attributes = getattributes(self.nc[0], _exclude_global)
+        self._attributes = dict(tileattrs[0])
         self._attributes['tile_number'] = 1
         self._attributes['bi'] = 1
         self._attributes['bj'] = 1
@@ -124,8 +252,8 @@ class MNC:
         if layout == 'model':
             self._nx = self.Nx
             self._ny = self.Ny
-            for nc in self.nc:
-                tn = nc.tile_number
+            for attrs in tileattrs:
+                tn = attrs['tile_number']
                 bj,bi = divmod(tn-1, ntx)
                 ie = sNx*(bi+1-ntx)
                 je = sNy*(bj+1-nty)
@@ -136,9 +264,9 @@ class MNC:
         elif layout == 'exch2':
             self._nx = 0
             self._ny = 0
-            for nc in self.nc:
-                i0 = nc.exch2_txGlobalo - 1
-                j0 = nc.exch2_tyGlobalo - 1
+            for attrs in tileattrs:
+                i0 = attrs['exch2_txGlobalo'] - 1
+                j0 = attrs['exch2_tyGlobalo'] - 1
                 ie = i0 + sNx
                 je = j0 + sNy
                 self._i0.append(i0)
@@ -156,10 +284,10 @@ class MNC:
         elif layout == 'faces':
             self._nx = {}
             self._ny = {}
-            for nc in self.nc:
-                fn = nc.exch2_myFace
-                i0 = nc.exch2_tBasex
-                j0 = nc.exch2_tBasey
+            for attrs in tileattrs:
+                fn = attrs['exch2_myFace']
+                i0 = attrs['exch2_tBasex']
+                j0 = attrs['exch2_tBasey']
                 ie = i0 + sNx
                 je = j0 + sNy
                 self._fn.append(fn)
@@ -187,7 +315,7 @@ class MNC:
 
         # dimensions
         self.dimensions = {}
-        for k,n in self.nc[0].dimensions.items():
+        for k,n in headers[0].dimensions.items():
             # compute size of dimension in global array for X* and Y*
             if k[0] == 'X':
                 n += self._nx - sNx
@@ -196,14 +324,24 @@ class MNC:
             self.dimensions[k] = n
 
         # variables
-        var0 = self.nc[0].variables
+        self._variables = headers[0].variables
         # find size of record dimension first
         if 'T' in self.dimensions and self.dimensions['T'] is None:
-            self.times = list(var0.get('T', [])[:])
-            self.iters = list(var0.get('iter', self.times)[:])
+            self.times = []
+            self.iters = []
+            # first record of each file group (and end of last)
+            self._recs = [0]
+            for g in range(len(self._fnames)):
+                # only the first tile file is needed for times
+                with self._open(g, 0) as nc:
+                    varg = nc.variables
+                    times = list(varg.get('T', [])[:])
+                    self.times.extend(times)
+                    self.iters.extend(varg.get('iter', times)[:])
+                self._recs.append(len(self.iters))
             self.nrec = len(self.iters)
 
-        self.variables = dict((k, MNCVariable(self, k)) for k in var0)
+        self.variables = dict((k, MNCVariable(self, k)) for k in self._variables)
 
     def __getattr__(self, k):
         try:
@@ -214,13 +352,41 @@ class MNC:
     def __dir__(self):
         return self.__dict__.keys() + self._attributes.keys()
 
+    def _open(self, g, i):
+        """Context manager for tile file i of file group g from the pool
+        of open files"""
+        return self._pool.open(self._fnames[g][i])
+
+    def _map(self, func, args):
+        """Call func for all args, in a thread pool if workers > 1"""
+        if self._workers is not None and self._workers > 1:
+            # byte swapping and copying release the GIL
+            from concurrent.futures import ThreadPoolExecutor
+            with ThreadPoolExecutor(self._workers) as pool:
+                for _ in pool.map(func, args):
+                    pass
+        else:
+            for a in args:
+                func(a)
+
     def close(self):
         """Close tile files"""
-        for nc in self.nc:
-            nc.close()
+        if self._pool is not None:
+            self._pool.close()
+        self._nc = None
 
     __del__ = close
 
+    @property
+    def nc(self):
+        """Open netcdf_file objects of all tiles (of the first iteration
+        for multitime), kept open until close; deprecated"""
+        warnings.warn('MNC.nc keeps all tile files open and is deprecated',
+                      DeprecationWarning, stacklevel=2)
+        if self._nc is None:
+            self._nc = [ self._pool.pin(f) for f in self._fnames[0] ]
+        return self._nc
+
     @property
     def faces(self):
         if self.layout == 'faces':
@@ -249,12 +415,12 @@ def calcstrides(slices, dims):
         try:
             stride = s.indices(dim)
         except AttributeError:
+            if s < 0: s += dim
             stride = (s, s+1, 1)
             n = 1
         else:
             # real slice, will make a dimension
-            start,stop,step = stride
-            n = (stop-start+step-1)//step
+            n = len(range(*stride))
             shape.append(n)
 
         fullshape.append(n)
@@ -266,7 +432,8 @@ def calcstrides(slices, dims):
 class MNCVariable(object):
     def __init__(self, mnc, name):
         self._name = name
-        self.nc = mnc.nc
+        self._mnc = mnc
+        self._ntiles = mnc._ntiles
         self.layout = mnc.layout
         self._i0 = mnc._i0
         self._ie = mnc._ie
@@ -274,16 +441,17 @@ class MNCVariable(object):
         self._je = mnc._je
         self._nf = mnc._nf
         self._fn = mnc._fn
-        v0 = mnc.nc[0].variables[name]
+        v0 = mnc._variables[name]
         self._attributes = getattributes(v0, _exclude_var)
-        self.itemsize = v0.data.itemsize
-        self.typecode = v0.typecode
-        self.dtype = np.dtype(self.typecode())
+        self._typecode = v0.typecode()
+        self.dtype = np.dtype(self._typecode)
+        self.itemsize = v0.itemsize()
         self.dimensions = v0.dimensions
         self.shape = tuple( mnc.dimensions[d] for d in self.dimensions )
         self.isrec = self.shape[0] is None
         if self.isrec:
             self.shape = (mnc.nrec,) + self.shape[1:]
+            self._recs = mnc._recs
 
         # which dimensions are tiled
         self._Xdim = None
@@ -292,6 +460,19 @@ class MNCVariable(object):
             if d[0] == 'X': self._Xdim = i
             if d[0] == 'Y': self._Ydim = i
 
+        # tile extents [lo,hi) along tiled dimensions, with tiles sorted by lo,
+        # for finding the tiles that intersect a slice
+        self._extents = []
+        if self.layout != 'faces':
+            for dim,i0s,ies in [(self._Xdim, self._i0, self._ie),
+                                (self._Ydim, self._j0, self._je)]:
+                if dim is not None:
+                    lo = np.array(i0s, int)
+                    hi = self.shape[dim] + np.array([ie or 0 for ie in ies], int)
+                    order = np.argsort(lo, kind='stable')
+                    width = max(hi - lo) if len(lo) else 0
+                    self._extents.append((dim, lo, hi, order, lo[order], width))
+
     def __getattr__(self, k):
         try:
             return self._attributes[k]
@@ -301,47 +482,144 @@ class MNCVariable(object):
     def __dir__(self):
         return self.__dict__.keys() + self._attributes.keys()
 
+    def typecode(self):
+        return self._typecode
+
+    def _recgroups(self, start=0, stop=None, step=1):
+        """ yield file group, records in file group and records in result
+            for records start:stop:step (group 0 for non-record variables) """
+        if not self.isrec:
+            yield 0, None, None
+            return
+        if stop is None:
+            stop = self.shape[0]
+        recs = np.arange(start, stop, step)
+        if len(recs) == 0:
+            return
+        groups = np.searchsorted(self._recs, recs, 'right') - 1
+        ks = np.r_[0, np.nonzero(np.diff(groups))[0] + 1, len(recs)]
+        for k0,k1 in zip(ks[:-1], ks[1:]):
+            g = int(groups[k0])
+            r0 = int(recs[k0]) - self._recs[g]
+            r1 = int(recs[k1-1]) - self._recs[g] + (1 if step > 0 else -1)
+            yield g, slice(r0, r1 if r1 >= 0 else None, step), slice(k0, k1)
+
+    def _cull(self, strides):
+        """ indices of the tiles that intersect the part selected by strides,
+            in O(log n + k) per tiled dimension """
+        tiles = None
+        for dim,lo,hi,order,losorted,width in self._extents:
+            start,stop,step = strides[dim]
+            # only tiles starting in (start - width, stop) can intersect
+            k0 = np.searchsorted(losorted, start - width, 'right')
+            k1 = np.searchsorted(losorted, stop)
+            cand = order[k0:k1]
+            cand = cand[hi[cand] > start]
+            if tiles is None:
+                tiles = cand
+            else:
+                tiles = np.intersect1d(tiles, cand)
+        if tiles is None:
+            return range(self._ntiles)
+        return np.sort(tiles).tolist()
+
+    def _assemble(self, tasks):
+        """ copy tiles into result arrays; tasks are tuples (file group, tile,
+            index into tile variable, result array, index into result) """
+        name = self._name
+        tile = self._mnc._open
+        def read(task):
+            g,i,src,res,dst = task
+            with tile(g, i) as nc:
+                res[dst] = nc.variables[name][src]
+        # tiles go to disjoint parts of the results, so no locking is needed
+        self._mnc._map(read, tasks)
+
     def __getitem__(self, ind):
         if self.layout == 'faces':
             return self._getfaces(ind)
 
+        cache = self._mnc._cache
+        key = None
+        if cache is not None:
+            key = _indexkey(ind)
+            if key is not None:
+                key = (self._name, key)
+                res = cache.get(key)
+                if res is not None:
+                    return res
+        res = self._getitem(ind)
+        if key is not None:
+            res.flags.writeable = False
+            cache.set(key, res)
+        return res
+
+    def _getitem(self, ind):
         if ind in [Ellipsis, slice(None)]:
             # whole array
             res = np.zeros(self.shape, self.typecode())
             s = [slice(None) for d in self.shape]
-            for i,nc in enumerate(self.nc):
-                if self._Xdim is not None:
-                    s[self._Xdim] = slice(self._i0[i], self._ie[i])
-                if self._Ydim is not None:
-                    s[self._Ydim] = slice(self._j0[i], self._je[i])
-                res[tuple(s)] = nc.variables[self._name][:]
+            src = slice(None)
+            tasks = []
+            for g,sg,sres in self._recgroups():
+                if self.isrec:
+                    src = sg
+                    s[0] = sres
+                for i in range(self._ntiles):
+                    if self._Xdim is not None:
+                        s[self._Xdim] = slice(self._i0[i], self._ie[i])
+                    if self._Ydim is not None:
+                        s[self._Ydim] = slice(self._j0[i], self._je[i])
+                    tasks.append((g, i, src, res, tuple(s)))
+            self._assemble(tasks)
 
             return res
         else:
             # read only required data
             strides,resshape,fullshape = calcstrides(ind, self.shape)
+            # read negative strides (except in the record dimension) in
+            # increasing order and reverse the result at the end
+            strides = list(strides)
+            flip = []
+            for dim,(I0,Ie,Is) in enumerate(strides):
+                flip.append(Is < 0 and not (dim == 0 and self.isrec))
+                if flip[-1]:
+                    n = fullshape[dim]
+                    strides[dim] = (I0 + (n-1)*Is, I0 + 1, -Is) if n else (0, 0, 1)
             res = np.zeros(fullshape, self.dtype)
             s = [slice(*stride) for stride in strides]
             sres = [slice(None) for d in fullshape]
-            if self._Xdim is not None: I0,Ie,Is = strides[self._Xdim]
-            if self._Ydim is not None: J0,Je,Js = strides[self._Ydim]
-            for i,nc in enumerate(self.nc):
-                if self._Xdim is not None:
-                    i0 = self._i0[i]
-                    ie = self.shape[self._Xdim] + (self._ie[i] or 0)
-                    a,b = divmod(I0 - i0, Is)
-                    e = np.clip(ie, I0, Ie)
-                    sres[self._Xdim] = slice(max(-a, 0), (e - I0)//Is)
-                    s[self._Xdim] = slice(max(I0 - i0, b), max(Ie - i0, 0), Is)
-                if self._Ydim is not None:
-                    j0 = self._j0[i]
-                    je = self.shape[self._Ydim] + (self._je[i] or 0)
-                    a,b = divmod(J0 - j0, Js)
-                    e = np.clip(je, J0, Je)
-                    sres[self._Ydim] = slice(max(-a, 0), (e - J0)//Js)
-                    s[self._Ydim] = slice(max(J0 - j0, b), max(Je - j0, 0), Js)
-                res[tuple(sres)] = nc.variables[self._name][tuple(s)]
-
+            # parts of the intersecting tiles that are selected
+            tileslices = []
+            for i in self._cull(strides):
+                tilesl = []
+                for dim,lo,hi,_,_,_ in self._extents:
+                    I0,Ie,Is = strides[dim]
+                    i0 = lo[i]
+                    ie = min(hi[i], Ie)
+                    # range of result that falls into tile
+                    k0 = max(0, -((I0 - i0)//Is))
+                    k1 = -((I0 - ie)//Is)
+                    if k1 <= k0:
+                        break
+                    tilesl.append((dim, slice(I0 + k0*Is - i0, ie - i0, Is), slice(k0, k1)))
+                else:
+                    tileslices.append((i, tilesl))
+            tasks = []
+            for g,sg,sresg in self._recgroups(*strides[0]):
+                if self.isrec:
+                    s[0] = sg
+                    sres[0] = sresg
+                for i,tilesl in tileslices:
+                    for dim,stile,sr in tilesl:
+                        s[dim] = stile
+                        sres[dim] = sr
+                    tasks.append((g, i, tuple(s), res, tuple(sres)))
+            self._assemble(tasks)
+
+            if any(flip):
+                res = res[tuple( slice(None, None, -1) if f else slice(None)
+                                 for f in flip )]
             return res.reshape(resshape)
 
     def _getfaces(self, ind):
@@ -351,40 +629,64 @@ class MNCVariable(object):
             a = np.zeros(shape, self.typecode())
             res.append(a)
         s = [slice(None) for d in self.shape]
-        for i,nc in enumerate(self.nc):
-            fn = self._fn[i]
-            if self._Xdim is not None:
-                s[self._Xdim] = slice(self._i0[i], self._ie[i])
-            if self._Ydim is not None:
-                s[self._Ydim] = slice(self._j0[i], self._je[i])
-            res[fn][tuple(s)] = nc.variables[self._name][:]
+        src = slice(None)
+        tasks = []
+        for g,sg,sres in self._recgroups():
+            if self.isrec:
+                src = sg
+                s[0] = sres
+            for i in range(self._ntiles):
+                fn = self._fn[i]
+                if self._Xdim is not None:
+                    s[self._Xdim] = slice(self._i0[i], self._ie[i])
+                if self._Ydim is not None:
+                    s[self._Ydim] = slice(self._j0[i], self._je[i])
+                tasks.append((g, i, src, res[fn], tuple(s)))
+        self._assemble(tasks)
         for f in range(self._nf):
             res[f] = res[f][ind]
 
         return res
 
-    def face(self, fn):
+    def face(self, fn, rec=None):
+        """ assemble face fn, or only record rec of a record variable """
         shape = tuple(np.isscalar(d) and d or d[fn] for d in self.shape)
+        if rec is not None and self.isrec:
+            shape = (1,) + shape[1:]
+            groups = self._recgroups(rec, rec + 1)
+        else:
+            groups = self._recgroups()
         res = np.zeros(shape, self.typecode())
         s = [slice(None) for d in self.shape]
-        for i,nc in enumerate(self.nc):
-            if self._fn[i] == fn:
-                if self._Xdim is not None:
-                    s[self._Xdim] = slice(self._i0[i], self._ie[i])
-                if self._Ydim is not None:
-                    s[self._Ydim] = slice(self._j0[i], self._je[i])
-                res[tuple(s)] = nc.variables[self._name][:]
-
+        src = slice(None)
+        tasks = []
+        for g,sg,sres in groups:
+            if self.isrec:
+                src = sg
+                s[0] = sres
+            for i in range(self._ntiles):
+                if self._fn[i] == fn:
+                    if self._Xdim is not None:
+                        s[self._Xdim] = slice(self._i0[i], self._ie[i])
+                    if self._Ydim is not None:
+                        s[self._Ydim] = slice(self._j0[i], self._je[i])
+                    tasks.append((g, i, src, res, tuple(s)))
+        self._assemble(tasks)
+
+        if rec is not None and self.isrec:
+            return res[0]
         return res
 
 
-def mnc_files(fpatt, layout=None):
-    return MNC(fpatt, layout)
+def mnc_files(fpatt, layout=None, multitime=False, workers=None, maxopen=128,
+              cache=0):
+    return MNC(fpatt, layout, multitime, workers, maxopen, cache)
 
 mnc_files.__doc__ = MNC.__doc__
 
 
-def rdmnc(fpatt, varnames=None, iters=None, slices=Ellipsis, layout=None):
+def rdmnc(fpatt, varnames=None, iters=None, slices=Ellipsis, layout=None,
+          multitime=False, workers=None):
     '''
     Read one or more variables from an mnc file set.
 
@@ -399,6 +701,10 @@ def rdmnc(fpatt, varnames=None, iters=None, slices=Ellipsis, layout=None):
     slices : tuple of slice objects
         tuple of slices to read from each variable
         (typically given as numpy.s_[...])
+    multitime : bool
+        if True, read files split in time (see mnc_files)
+    workers : int or None
+        number of threads used to assemble tiles (see mnc_files)
 
     Returns
     -------
@@ -411,15 +717,13 @@ def rdmnc(fpatt, varnames=None, iters=None, slices=Ellipsis, layout=None):
     >>> u = S['U']
     >>> v = S['V']
 
+    >>> S = rdmnc('mnc_*/state.*.t*.nc', 'Temp', iters=[72000], multitime=True)
+
     Notes
     -----
-    Can currently read only one file set (i.e., 1 file per tile),
-    not several files split in time.
-
     Consider using mnc_files for more control (and similar convenience).
-    The same restriction about multiple files applies, however.
     '''
-    mnc = MNC(fpatt, layout)
+    mnc = MNC(fpatt, layout, multitime, workers)
     if varnames is None:
         varnames = mnc.variables.keys()
     elif isinstance(varnames, str):
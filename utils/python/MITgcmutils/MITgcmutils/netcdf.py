@@ -34,12 +34,15 @@ __all__ = ['netcdf_file']
 
 from operator import mul
 from mmap import mmap, ACCESS_READ
+import struct
 
 import numpy as np
 from numpy import frombuffer, ndarray, dtype, empty, array, asarray
 from numpy import little_endian as LITTLE_ENDIAN
 from functools import reduce
 
+from ._cache import _LRUCache
+
 import sys
 
 PY3 = sys.version_info[0] == 3
@@ -48,7 +51,14 @@ if PY3:
 else:
     integer_types = (int, long)
 
-ABSENT = b'\x00\x00\x00\x00\x00\x00\x00\x00'
+_INT32 = struct.Struct('>i')
+_INT64 = struct.Struct('>q')
+_TYPE_COUNT = struct.Struct('>4si')
+_TYPE_COUNT64 = struct.Struct('>4sq')
+
+# number of bytes read at once when parsing the header
+HEADER_CHUNK = 8192
+
 ZERO = b'\x00\x00\x00\x00'
 NC_BYTE = b'\x00\x00\x00\x01'
 NC_CHAR = b'\x00\x00\x00\x02'
@@ -56,6 +66,11 @@ NC_SHORT = b'\x00\x00\x00\x03'
 NC_INT = b'\x00\x00\x00\x04'
 NC_FLOAT = b'\x00\x00\x00\x05'
 NC_DOUBLE = b'\x00\x00\x00\x06'
+NC_UBYTE = b'\x00\x00\x00\x07'
+NC_USHORT = b'\x00\x00\x00\x08'
+NC_UINT = b'\x00\x00\x00\x09'
+NC_INT64 = b'\x00\x00\x00\x0a'
+NC_UINT64 = b'\x00\x00\x00\x0b'
 NC_DIMENSION = b'\x00\x00\x00\n'
 NC_VARIABLE = b'\x00\x00\x00\x0b'
 NC_ATTRIBUTE = b'\x00\x00\x00\x0c'
@@ -66,7 +81,12 @@ TYPEMAP = {NC_BYTE: ('b', 1),
             NC_SHORT: ('h', 2),
             NC_INT: ('i', 4),
             NC_FLOAT: ('f', 4),
-            NC_DOUBLE: ('d', 8)}
+            NC_DOUBLE: ('d', 8),
+            NC_UBYTE: ('B', 1),
+            NC_USHORT: ('H', 2),
+            NC_UINT: ('I', 4),
+            NC_INT64: ('q', 8),
+            NC_UINT64: ('Q', 8)}
 
 REVERSE = {('b', 1): NC_BYTE,
             ('B', 1): NC_CHAR,
@@ -81,6 +101,17 @@ REVERSE = {('b', 1): NC_BYTE,
             ('l', 4): NC_INT,
             ('S', 1): NC_CHAR}
 
+# CDF-5 (64-bit data format) adds unsigned and 64-bit integer types
+REVERSE5 = dict(REVERSE)
+REVERSE5.update({('B', 1): NC_UBYTE,
+                 ('H', 2): NC_USHORT,
+                 ('I', 4): NC_UINT,
+                 ('L', 4): NC_UINT,
+                 ('l', 8): NC_INT64,
+                 ('q', 8): NC_INT64,
+                 ('L', 8): NC_UINT64,
+                 ('Q', 8): NC_UINT64})
+
 
 class netcdf_file(object):
     """
@@ -100,17 +131,35 @@ class netcdf_file(object):
     ----------
     filename : string or file-like
         string -> filename
-    mode : {'r', 'w'}, optional
-        read-write mode, default is 'r'
+    mode : {'r', 'w', 'a'}, optional
+        read-write mode, default is 'r'.  'a' opens an existing file
+        to append records with `append_record`.
     mmap : None or bool, optional
         Whether to mmap `filename` when reading.  Default is True
         when `filename` is a file name, False when `filename` is a
         file-like object
-    version : {1, 2}, optional
+    version : {1, 2, 5}, optional
         version of netcdf to read / write, where 1 means *Classic
-        format* and 2 means *64-bit offset format*.  Default is 1.  See
+        format*, 2 means *64-bit offset format* and 5 means *64-bit data
+        format* (CDF-5), which has 64-bit dimension lengths and counts,
+        no limit on the size of variables, and the unsigned and 64-bit
+        integer types.  Default is 1.  See
         `here <http://www.unidata.ucar.edu/software/netcdf/docs/netcdf/Which-Format.html>`_
         for more info.
+    header_only : bool, optional
+        Only read dimensions, attributes and variable metadata, not the
+        data (mode 'r' only).  The file is closed after reading the
+        header and no mmaps are created, so the object can be kept, e.g.,
+        in a cache.  Indexing its variables raises an error.
+    native : bool, optional
+        If True, indexing a variable returns a native-endian array, byte
+        swapped once per slice, instead of a big-endian view of the file,
+        which is swapped again by every arithmetic operation.
+        `netcdf_variable.data` remains big-endian.
+    cache : int, optional
+        With `native`, keep the swapped arrays of the `cache` most
+        recently read slices (basic indices only) and return them again,
+        read-only, when the same slice is requested.  Default is 0.
 
     Notes
     -----
@@ -187,9 +236,30 @@ class netcdf_file(object):
         >>> with netcdf.netcdf_file('simple.nc', 'r') as f:
         >>>     print(f.history)
         Created for a test
+
+    Records can be written one at a time as they are produced, without
+    keeping the data set in memory:
+
+        >>> f = netcdf.netcdf_file('series.nc', 'w')
+        >>> f.createDimension('time', None)
+        >>> f.createDimension('x', 100)
+        >>> time = f.createVariable('time', 'i', ('time',))
+        >>> u = f.createVariable('u', 'f', ('time', 'x'))
+        >>> for it in range(10):
+        >>>     f.append_record({'time': it, 'u': np.random.rand(100)})
+        >>> f.close()
+
+    and appended to later by opening the file in mode 'a'.
     """
-    def __init__(self, filename, mode='r', mmap=None, version=1):
+    def __init__(self, filename, mode='r', mmap=None, version=1,
+                 header_only=False, native=False, cache=0):
         """Initialize netcdf_file from fileobj (str or file-like)."""
+        if mode not in ('r', 'w', 'a'):
+            raise ValueError("Mode must be 'r', 'w' or 'a'.")
+        if header_only and mode != 'r':
+            raise ValueError("header_only requires mode 'r'.")
+        if mode == 'w' and version not in (1, 2, 5):
+            raise ValueError("version must be 1, 2 or 5.")
         if hasattr(filename, 'seek'):  # file-like
             self.fp = filename
             self.filename = 'None'
@@ -199,15 +269,16 @@ class netcdf_file(object):
                 raise ValueError('Cannot use file object for mmap')
         else:  # maybe it's a string
             self.filename = filename
-            self.fp = open(self.filename, '%sb' % mode)
+            self.fp = open(self.filename, {'a': 'r+b'}.get(mode, mode + 'b'))
             if mmap is None:
                 mmap = True
-        self.use_mmap = mmap
+        self.use_mmap = mmap and not header_only and mode == 'r'
+        self.header_only = header_only
+        self.native = native
+        self._cache = _LRUCache(cache) if native and cache else None
         self._fds = []
         self.version_byte = version
-
-        if not mode in 'rw':
-            raise ValueError("Mode must be either 'r' or 'w'.")
+        self._appending = False
         self.mode = mode
 
         self.dimensions = {}
@@ -219,8 +290,12 @@ class netcdf_file(object):
 
         self._attributes = {}
 
-        if mode == 'r':
+        if mode in 'ra':
             self._read()
+            if native:
+                for var in self.variables.values():
+                    var.__dict__['_native'] = True
+                    var.__dict__['_cache'] = self._cache
 
     def __setattr__(self, attr, value):
         # Store user defined attributes in a separate dict,
@@ -271,6 +346,11 @@ class netcdf_file(object):
         createVariable
 
         """
+        if self._appending:
+            raise RuntimeError("Cannot add dimensions after appending records.")
+        if length and length > 2**31 - 1 and self.version_byte != 5:
+            raise ValueError("Dimension %s is too long for NetCDF version %d; "
+                             "use version=5." % (name, self.version_byte))
         self.dimensions[name] = length
         self._dims.append(name)
 
@@ -305,13 +385,16 @@ class netcdf_file(object):
         creating the NetCDF variable.
 
         """
+        if self._appending:
+            raise RuntimeError("Cannot add variables after appending records.")
         shape = tuple([self.dimensions[dim] for dim in dimensions])
         shape_ = tuple([dim or 0 for dim in shape])  # replace None with 0 for numpy
 
         type = dtype(type)
         typecode, size = type.char, type.itemsize
-        if (typecode, size) not in REVERSE:
-            raise ValueError("NetCDF 3 does not support type %s" % type)
+        if (typecode, size) not in self._reverse:
+            raise ValueError("NetCDF version %d does not support type %s" %
+                             (self.version_byte, type))
 
         data = empty(shape_, dtype=type.newbyteorder("B"))  # convert to big endian always for NetCDF 3
         self.variables[name] = netcdf_variable(data, typecode, size, shape, dimensions)
@@ -321,43 +404,154 @@ class netcdf_file(object):
         """
         Perform a sync-to-disk flush if the `netcdf_file` object is in write mode.
 
+        Once records have been appended, only the file buffers are flushed,
+        as the header and records are already written.
+
         See Also
         --------
         sync : Identical function
 
         """
-        if hasattr(self, 'mode') and self.mode == 'w':
+        if not hasattr(self, 'mode') or self.mode == 'r':
+            return
+        if self.mode == 'w' and not self._appending:
             self._write()
+        self.fp.flush()
     sync = flush
 
-    def _write(self):
+    def append_record(self, values):
+        """
+        Append one record to the record variables and write it to file.
+
+        In mode 'w' the first call writes the header and the data of the
+        other variables, after which no dimensions or variables can be
+        added.  The number of records in the header is updated in place
+        after each record, so only one record is held in memory and the
+        file can be read while it is being written.  The record variables
+        hold no data in memory.
+
+        Parameters
+        ----------
+        values : dict
+            One record of data, keyed by record variable name.  Record
+            variables not in `values` are written as zeros.
+
+        """
+        if self.mode == 'r':
+            raise RuntimeError("Cannot append records in mode 'r'.")
+        if not self._appending:
+            self._write()
+            self.fp.seek(0, 2)
+            self._start_append([k for k in self._sorted_variables()
+                                if self.variables[k].isrec])
+        unknown = set(values) - set(self._recbufs)
+        if unknown:
+            raise ValueError("Not record variables: %s" %
+                             ', '.join(sorted(unknown)))
+
+        for name, buf, padding in self._recvars:
+            value = values.get(name)
+            if value is None:
+                buf[...] = 0
+                value = buf
+            else:
+                value = asarray(value)
+                if (value.dtype != buf.dtype or value.shape != buf.shape
+                        or not value.flags.c_contiguous):
+                    # convert into the reusable buffer
+                    buf[...] = value
+                    value = buf
+            self.fp.write(memoryview(value))
+            self.fp.write(padding)
+
+        self.__dict__['_recs'] += 1
+        pos = self.fp.tell()
+        self.fp.seek(4)
+        self._pack_count(self._recs)
+        self.fp.seek(pos)
+        for name, buf, padding in self._recvars:
+            self.variables[name].__dict__['_recs'] = self._recs
+
+    def _start_append(self, names):
+        # set up a buffer of one record and the padding for each record
+        # variable (in file order); the file is positioned after the last
+        # record
+        recvars = []
+        for name in names:
+            var = self.variables[name]
+            buf = empty(var._shape[1:], '>%s' % var.typecode())
+            count = buf.size * buf.itemsize
+            padding = b'\x00' * (-count % 4 if len(names) > 1 else 0)
+            recvars.append((name, buf, padding))
+            var.__dict__['data'] = None
+            var.__dict__['_recs'] = self._recs
+        self.__dict__['_recvars'] = recvars
+        self.__dict__['_recbufs'] = dict((name, buf)
+                                         for name, buf, padding in recvars)
+        self.__dict__['_appending'] = True
+
+    def write_header(self, numrecs=0):
+        """
+        Write only the header, for `numrecs` records, in mode 'w'.
+
+        The file is extended to its full size and the data can then be
+        written at the positions given by `data_offset`, e.g., from
+        several threads with ``os.pwrite(f.fp.fileno(), ...)``, or records
+        appended with `append_record`.  Afterwards, the variables hold no
+        data in memory and no dimensions or variables can be added.
+
+        Parameters
+        ----------
+        numrecs : int
+            number of records
+
+        """
+        if self.mode != 'w' or self._appending:
+            raise RuntimeError("write_header needs a new file in mode 'w'.")
+        self.__dict__['_recs'] = numrecs
+        self._write(data=False)
+        self._start_append([k for k in self._sorted_variables()
+                            if self.variables[k].isrec])
+        self.fp.flush()
+
+    def data_offset(self, name, rec=0):
+        """
+        Return the position in the file of the data of variable `name`,
+        or of record `rec` of a record variable, once written.
+        """
+        var = self.variables[name]
+        if var.isrec:
+            return var._offset + rec*self._recsize
+        return var._offset
+
+    def _write(self, data=True):
         self.fp.seek(0)
         self.fp.write(b'CDF')
-        self.fp.write(array(self.version_byte, '>b').tostring())
+        self.fp.write(array(self.version_byte, '>b').tobytes())
 
         # Write headers and data.
         self._write_numrecs()
         self._write_dim_array()
         self._write_gatt_array()
-        self._write_var_array()
+        self._write_var_array(data)
 
     def _write_numrecs(self):
         # Get highest record count from all record variables.
         for var in self.variables.values():
             if var.isrec and len(var.data) > self._recs:
                 self.__dict__['_recs'] = len(var.data)
-        self._pack_int(self._recs)
+        self._pack_count(self._recs)
 
     def _write_dim_array(self):
         if self.dimensions:
             self.fp.write(NC_DIMENSION)
-            self._pack_int(len(self.dimensions))
+            self._pack_count(len(self.dimensions))
             for name in self._dims:
                 self._pack_string(name)
                 length = self.dimensions[name]
-                self._pack_int(length or 0)  # replace None with 0 for record dimension
+                self._pack_count(length or 0)  # replace None with 0 for record dimension
         else:
-            self.fp.write(ABSENT)
+            self._write_absent()
 
     def _write_gatt_array(self):
         self._write_att_array(self._attributes)
@@ -365,23 +559,19 @@ class netcdf_file(object):
     def _write_att_array(self, attributes):
         if attributes:
             self.fp.write(NC_ATTRIBUTE)
-            self._pack_int(len(attributes))
+            self._pack_count(len(attributes))
             for name, values in attributes.items():
                 self._pack_string(name)
                 self._write_values(values)
         else:
-            self.fp.write(ABSENT)
+            self._write_absent()
 
-    def _write_var_array(self):
+    def _write_var_array(self, data=True):
         if self.variables:
             self.fp.write(NC_VARIABLE)
-            self._pack_int(len(self.variables))
+            self._pack_count(len(self.variables))
 
-            # Sort variables non-recs first, then recs. We use a DSU
-            # since some people use pupynere with Python 2.3.x.
-            deco = [(bool(v._shape) and not v.isrec, k) for (k, v) in self.variables.items()]
-            deco.sort()
-            variables = [k for (unused, k) in deco][::-1]
+            variables = self._sorted_variables()
 
             # Set the metadata for all variables.
             for name in variables:
@@ -391,40 +581,74 @@ class netcdf_file(object):
             self.__dict__['_recsize'] = sum([
                     var._vsize for var in self.variables.values()
                     if var.isrec])
+            if not data:
+                self._write_var_begins(variables)
+                return
             # Set the data for all variables.
             for name in variables:
                 self._write_var_data(name)
         else:
-            self.fp.write(ABSENT)
+            self._write_absent()
+
+    def _write_var_begins(self, variables):
+        # set begin of all variables and extend the file (with zeros) to
+        # the size of the data
+        pos = end = self.fp.tell()
+        for name in variables:
+            var = self.variables[name]
+            var.__dict__['_offset'] = pos
+            self.fp.seek(var._begin)
+            self._pack_begin(pos)
+            pos += var._vsize
+            if not var.isrec:
+                end = pos
+        end += self._recs*self._recsize
+        self.fp.truncate(end)
+        self.fp.seek(end)
+
+    def _sorted_variables(self):
+        # Sort variables non-recs first, then recs. We use a DSU
+        # since some people use pupynere with Python 2.3.x.
+        deco = [(not v.isrec, k) for (k, v) in self.variables.items()]
+        deco.sort()
+        return [k for (unused, k) in deco][::-1]
+
+    def _write_absent(self):
+        self.fp.write(ZERO)
+        self._pack_count(0)
 
     def _write_var_metadata(self, name):
         var = self.variables[name]
 
         self._pack_string(name)
-        self._pack_int(len(var.dimensions))
+        self._pack_count(len(var.dimensions))
         for dimname in var.dimensions:
             dimid = self._dims.index(dimname)
-            self._pack_int(dimid)
+            self._pack_count(dimid)
 
         self._write_att_array(var._attributes)
 
-        nc_type = REVERSE[var.typecode(), var.itemsize()]
+        nc_type = self._reverse[var.typecode(), var.itemsize()]
         self.fp.write(nc_type)
 
         if not var.isrec:
             vsize = var.data.size * var.data.itemsize
             vsize += -vsize % 4
         else:  # record variable
-            try:
-                vsize = var.data[0].size * var.data.itemsize
-            except IndexError:
-                vsize = 0
+            vsize = reduce(mul, var._shape[1:], 1) * var.data.itemsize
             rec_vars = len([v for v in self.variables.values()
                             if v.isrec])
             if rec_vars > 1:
                 vsize += -vsize % 4
         self.variables[name].__dict__['_vsize'] = vsize
-        self._pack_int(vsize)
+        if self.version_byte == 5:
+            self._pack_int64(vsize)
+        elif vsize < 2**32 - 4:
+            self._pack_int(vsize)
+        else:
+            # too large for the 32-bit vsize field, 2^32 - 1 is used
+            # instead and readers compute the size from the shape
+            self._pack_int(-1)
 
         # Pack a bogus begin, and set the real value later.
         self.variables[name].__dict__['_begin'] = self.fp.tell()
@@ -435,13 +659,14 @@ class netcdf_file(object):
 
         # Set begin in file header.
         the_beguine = self.fp.tell()
+        var.__dict__['_offset'] = the_beguine
         self.fp.seek(var._begin)
         self._pack_begin(the_beguine)
         self.fp.seek(the_beguine)
 
         # Write data.
         if not var.isrec:
-            self.fp.write(var.data.tostring())
+            self.fp.write(memoryview(var.data))
             count = var.data.size * var.data.itemsize
             self.fp.write(b'0' * (var._vsize - count))
         else:  # record variable
@@ -458,7 +683,7 @@ class netcdf_file(object):
                 if not rec.shape and (rec.dtype.byteorder == '<' or
                         (rec.dtype.byteorder == '=' and LITTLE_ENDIAN)):
                     rec = rec.byteswap()
-                self.fp.write(rec.tostring())
+                self.fp.write(rec.tobytes())
                 # Padding
                 count = rec.size * rec.itemsize
                 self.fp.write(b'0' * (var._vsize - count))
@@ -467,8 +692,11 @@ class netcdf_file(object):
             self.fp.seek(pos0 + var._vsize)
 
     def _write_values(self, values):
+        if isinstance(values, bytes) and not isinstance(values, str):
+            # e.g., character attributes read from a file
+            values = values.decode('latin1')
         if hasattr(values, 'dtype'):
-            nc_type = REVERSE[values.dtype.char, values.dtype.itemsize]
+            nc_type = self._reverse[values.dtype.char, values.dtype.itemsize]
         else:
             types = [(t, NC_INT) for t in integer_types]
             types += [
@@ -499,41 +727,76 @@ class netcdf_file(object):
             nelems = values.itemsize
         else:
             nelems = values.size
-        self._pack_int(nelems)
+        self._pack_count(nelems)
 
         if not values.shape and (values.dtype.byteorder == '<' or
                 (values.dtype.byteorder == '=' and LITTLE_ENDIAN)):
             values = values.byteswap()
-        self.fp.write(values.tostring())
+        self.fp.write(values.tobytes())
         count = values.size * values.itemsize
         self.fp.write(b'0' * (-count % 4))  # pad
 
     def _read(self):
+        # Read the header in one go (usually) and parse it from memory.
+        self.__dict__['_hbuf'] = memoryview(self.fp.read(HEADER_CHUNK))
+        self.__dict__['_hpos'] = 0
+        self._read_header()
+        del self.__dict__['_hbuf']
+        del self.__dict__['_hpos']
+
+        self._read_var_data(*self._varinfo)
+        del self.__dict__['_varinfo']
+
+    def _read_header(self):
         # Check magic bytes and version
-        magic = self.fp.read(3)
+        magic = self._read_bytes(3)
         if not magic == b'CDF':
             raise TypeError("Error: %s is not a valid NetCDF 3 file" %
                             self.filename)
-        self.__dict__['version_byte'] = frombuffer(self.fp.read(1), '>b')[0]
+        version = frombuffer(self._read_bytes(1), '>b')[0]
+        if version not in (1, 2, 5):
+            raise TypeError("Error: %s has unsupported NetCDF version %d" %
+                            (self.filename, version))
+        self.__dict__['version_byte'] = version
 
-        # Read file headers and set data.
+        # Read file headers.
         self._read_numrecs()
         self._read_dim_array()
         self._read_gatt_array()
         self._read_var_array()
 
+    def _header_need(self, count):
+        # make sure the next count bytes of the header are in the buffer,
+        # reading at least as much again as has been read so far
+        pos = self._hpos
+        end = pos + count
+        if end > len(self._hbuf):
+            more = self.fp.read(max(end - len(self._hbuf), len(self._hbuf)))
+            buf = self._hbuf.tobytes() + more
+            if len(buf) < end:
+                raise ValueError("Unexpected end of header in %s" %
+                                 self.filename)
+            self.__dict__['_hbuf'] = memoryview(buf)
+        self.__dict__['_hpos'] = end
+        return pos
+
+    def _read_bytes(self, count):
+        # read count bytes of the header
+        pos = self._header_need(count)
+        return self._hbuf[pos:pos+count].tobytes()
+
     def _read_numrecs(self):
-        self.__dict__['_recs'] = self._unpack_int()
+        self.__dict__['_recs'] = self._unpack_count()
 
     def _read_dim_array(self):
-        header = self.fp.read(4)
+        header = self._read_bytes(4)
         if not header in [ZERO, NC_DIMENSION]:
             raise ValueError("Unexpected header.")
-        count = self._unpack_int()
+        count = self._unpack_count()
 
         for dim in range(count):
             name = self._unpack_string()
-            length = self._unpack_int() or None  # None for record dimension
+            length = self._unpack_count() or None  # None for record dimension
             self.dimensions[name] = length
             self._dims.append(name)  # preserve order
 
@@ -542,10 +805,10 @@ class netcdf_file(object):
             self.__setattr__(k, v)
 
     def _read_att_array(self):
-        header = self.fp.read(4)
+        header = self._read_bytes(4)
         if not header in [ZERO, NC_ATTRIBUTE]:
             raise ValueError("Unexpected header.")
-        count = self._unpack_int()
+        count = self._unpack_count()
 
         attributes = {}
         for attr in range(count):
@@ -554,18 +817,14 @@ class netcdf_file(object):
         return attributes
 
     def _read_var_array(self):
-        header = self.fp.read(4)
+        header = self._read_bytes(4)
         if not header in [ZERO, NC_VARIABLE]:
             raise ValueError("Unexpected header.")
 
-        nrsize = 0
-        nrbegin = 0
         recbegin = 0
-        nrdtype = {'names': [], 'formats': []}
-        recdtype = {'names': [], 'formats': []}
         nr_vars = []
         rec_vars = []
-        count = self._unpack_int()
+        count = self._unpack_count()
         for var in range(count):
             (name, dimensions, shape, attributes,
              typecode, size, dtype_, begin_, vsize) = self._read_var()
@@ -583,85 +842,92 @@ class netcdf_file(object):
             # 32-bit vsize field is not large enough to contain the size
             # of variables that require more than 2^32 - 4 bytes, so
             # 2^32 - 1 is used in the vsize field for such variables.
-            isrec = shape and shape[0] is None  # record variable
+            # CDF-5 has a 64-bit vsize field.
+            isrec = bool(shape) and shape[0] is None  # record variable
             recshape = shape[isrec:]  # shape without record dimension
-
-            # construct dtype
-            names = [name]
-            formats = [str(recshape) + dtype_]
-            # Handle padding with a virtual variable.
-            if typecode in 'bch':
-                actual_size = reduce(mul, recshape, 1) * size
-                padding = -actual_size % 4
-                if padding:
-                    names.append('_padding_%d' % var)
-                    formats.append('(%d,)>b' % padding)
+            if vsize == 2**32 - 1 and self.version_byte != 5:
+                vsize = reduce(mul, recshape, 1) * size
+                vsize += -vsize % 4
 
             if isrec:
-                rec_vars.append(name)
+                rec_vars.append((name, begin_))
                 # The netCDF "record size" is calculated as the sum of
                 # the vsize's of all the record variables.
                 self.__dict__['_recsize'] += vsize
                 if recbegin == 0:
                     recbegin = begin_
-                recdtype['names'].extend(names)
-                recdtype['formats'].extend(formats)
-
-                # Data will be set later.
-                data = None
             else:  # not a record variable
-                nr_vars.append(name)
-                nrsize += vsize
-                if nrbegin == 0:
-                    nrbegin = begin_
-                nrdtype['names'].extend(names)
-                nrdtype['formats'].extend(formats)
+                nr_vars.append((name, begin_, reduce(mul, shape, 1) * size))
 
-                # Calculate size to avoid problems with vsize (above)
-                a_size = reduce(mul, shape, 1) * size
-                if self.use_mmap:
-                    data = None
-                else:
-                    pos = self.fp.tell()
-                    self.fp.seek(begin_)
-                    data = frombuffer(self.fp.read(a_size), dtype=dtype_)
-                    data.shape = shape
-                    self.fp.seek(pos)
-
-            # Add variable.
+            # Add variable.  Data will be set later.
             self.variables[name] = netcdf_variable(
-                    data, typecode, size, shape, dimensions, attributes)
+                    None, typecode, size, shape, dimensions, attributes)
+            self.variables[name].__dict__['_recs'] = self._recs
+
+        self.__dict__['_varinfo'] = (recbegin, nr_vars, rec_vars)
+
+    def _read_var_data(self, recbegin, nr_vars, rec_vars):
+        # Each variable is a view of the mmap (or of the bytes read) at
+        # its begin offset.  Record variables are strided by the record
+        # size.  Structured arrays are not used, as their items are
+        # limited to 2 GiB.
+        if self.header_only:
+            self.fp.close()
+            return
+        if self.mode == 'a':
+            self._start_append([var for var, begin_ in rec_vars])
+            if rec_vars:
+                recsize = sum(buf.size * buf.itemsize + len(padding)
+                              for name, buf, padding in self._recvars)
+                self.fp.seek(recbegin + self._recs*recsize)
+            else:
+                self.fp.seek(0, 2)
+            return
 
         if self.use_mmap:
-            # Build nonrec array.
-            mm = mmap(self.fp.fileno(), nrbegin+nrsize, access=ACCESS_READ)
-            nr_array = ndarray.__new__(ndarray, (), dtype=nrdtype, buffer=mm,
-                    offset=nrbegin, order='C')
+            mm = mmap(self.fp.fileno(), 0, access=ACCESS_READ)
             self._fds.append(mm)
-            for var in nr_vars:
-                self.variables[var].__dict__['data'] = nr_array[var]
+            for var, begin_, a_size in nr_vars:
+                v = self.variables[var]
+                v.__dict__['data'] = ndarray.__new__(ndarray, v._shape,
+                        dtype='>%s' % v.typecode(), buffer=mm, offset=begin_)
+        else:
+            for var, begin_, a_size in nr_vars:
+                # Calculate size to avoid problems with vsize (above)
+                v = self.variables[var]
+                self.fp.seek(begin_)
+                data = frombuffer(self.fp.read(a_size), dtype='>%s' % v.typecode())
+                data.shape = v._shape
+                v.__dict__['data'] = data
 
         if rec_vars:
-            # Remove padding when only one record variable.
             if len(rec_vars) == 1:
-                recdtype['names'] = recdtype['names'][:1]
-                recdtype['formats'] = recdtype['formats'][:1]
+                # no padding when only one record variable
+                v = self.variables[rec_vars[0][0]]
+                recsize = reduce(mul, v._shape[1:], 1) * v.itemsize()
+            else:
+                recsize = self._recsize
 
-            # Build rec array.
             if self.use_mmap:
-                mm = mmap(self.fp.fileno(), recbegin+self._recs*self._recsize, access=ACCESS_READ)
-                rec_array = ndarray.__new__(ndarray, (self._recs,), dtype=recdtype,
-                        buffer=mm, offset=recbegin, order='C')
-                self._fds.append(mm)
+                buf = mm
+                offset = 0
             else:
-                pos = self.fp.tell()
                 self.fp.seek(recbegin)
-                rec_array = frombuffer(self.fp.read(self._recs*self._recsize), dtype=recdtype)
-                rec_array.shape = (self._recs,)
-                self.fp.seek(pos)
-
-            for var in rec_vars:
-                self.variables[var].__dict__['data'] = rec_array[var]
+                buf = self.fp.read(self._recs*recsize)
+                offset = recbegin
+
+            for var, begin_ in rec_vars:
+                v = self.variables[var]
+                shape = (self._recs,) + v._shape[1:]
+                strides = [recsize] + [reduce(mul, shape[i+1:], 1) * v.itemsize()
+                                       for i in range(1, len(shape))]
+                if self._recs == 0:
+                    data = empty(shape, dtype='>%s' % v.typecode())
+                else:
+                    data = ndarray.__new__(ndarray, shape,
+                            dtype='>%s' % v.typecode(), buffer=buf,
+                            offset=begin_-offset, strides=tuple(strides))
+                v.__dict__['data'] = data
 
         # further reading will be done through the mmaps
         self.fp.close()
@@ -670,10 +936,10 @@ class netcdf_file(object):
         name = self._unpack_string()
         dimensions = []
         shape = []
-        dims = self._unpack_int()
+        dims = self._unpack_count()
 
         for i in range(dims):
-            dimid = self._unpack_int()
+            dimid = self._unpack_count()
             dimname = self._dims[dimid]
             dimensions.append(dimname)
             dim = self.dimensions[dimname]
@@ -682,9 +948,15 @@ class netcdf_file(object):
         shape = tuple(shape)
 
         attributes = self._read_att_array()
-        nc_type = self.fp.read(4)
-        vsize = self._unpack_int()
-        begin = [self._unpack_int, self._unpack_int64][self.version_byte-1]()
+        nc_type = self._read_bytes(4)
+        if self.version_byte == 5:
+            vsize = self._unpack_int64()
+        else:
+            vsize = self._unpack_int() % 2**32
+        if self.version_byte == 1:
+            begin = self._unpack_int()
+        else:
+            begin = self._unpack_int64()
 
         typecode, size = TYPEMAP[nc_type]
         dtype_ = '>%s' % typecode
@@ -692,14 +964,18 @@ class netcdf_file(object):
         return name, dimensions, shape, attributes, typecode, size, dtype_, begin, vsize
 
     def _read_values(self):
-        nc_type = self.fp.read(4)
-        n = self._unpack_int()
+        if self.version_byte == 5:
+            pos = self._header_need(12)
+            nc_type, n = _TYPE_COUNT64.unpack_from(self._hbuf, pos)
+        else:
+            pos = self._header_need(8)
+            nc_type, n = _TYPE_COUNT.unpack_from(self._hbuf, pos)
 
         typecode, size = TYPEMAP[nc_type]
 
-        count = n*size
-        values = self.fp.read(int(count))
-        self.fp.read(-count % 4)  # read padding
+        count = int(n*size)
+        pos = self._header_need(count + -count % 4)  # including padding
+        values = self._hbuf[pos:pos+count].tobytes()
 
         if typecode != 'c':
             values = frombuffer(values, dtype='>%s' % typecode)
@@ -712,33 +988,54 @@ class netcdf_file(object):
     def _pack_begin(self, begin):
         if self.version_byte == 1:
             self._pack_int(begin)
-        elif self.version_byte == 2:
+        else:
             self._pack_int64(begin)
 
+    @property
+    def _reverse(self):
+        # map from (typecode, size) to nc_type for this version
+        if self.version_byte == 5:
+            return REVERSE5
+        return REVERSE
+
+    def _pack_count(self, value):
+        # counts and dimension lengths are 64 bit in CDF-5
+        if self.version_byte == 5:
+            self._pack_int64(value)
+        else:
+            self._pack_int(value)
+
+    def _unpack_count(self):
+        if self.version_byte == 5:
+            return self._unpack_int64()
+        return self._unpack_int()
+
     def _pack_int(self, value):
-        self.fp.write(array(value, '>i').tostring())
+        self.fp.write(array(value, '>i').tobytes())
     _pack_int32 = _pack_int
 
     def _unpack_int(self):
-        return int(frombuffer(self.fp.read(4), '>i')[0])
+        pos = self._header_need(4)
+        return _INT32.unpack_from(self._hbuf, pos)[0]
     _unpack_int32 = _unpack_int
 
     def _pack_int64(self, value):
-        self.fp.write(array(value, '>q').tostring())
+        self.fp.write(array(value, '>q').tobytes())
 
     def _unpack_int64(self):
-        return frombuffer(self.fp.read(8), '>q')[0]
+        pos = self._header_need(8)
+        return _INT64.unpack_from(self._hbuf, pos)[0]
 
     def _pack_string(self, s):
         count = len(s)
-        self._pack_int(count)
+        self._pack_count(count)
         self.fp.write(s.encode('latin1'))
         self.fp.write(b'0' * (-count % 4))  # pad
 
     def _unpack_string(self):
-        count = self._unpack_int()
-        s = self.fp.read(count).rstrip(b'\x00')
-        self.fp.read(-count % 4)  # read padding
+        count = self._unpack_count()
+        pos = self._header_need(count + -count % 4)  # including padding
+        s = self._hbuf[pos:pos+count].tobytes().rstrip(b'\x00')
         return s.decode('latin1')
 
 
@@ -792,6 +1089,10 @@ class netcdf_variable(object):
     isrec, shape
 
     """
+    # set by netcdf_file(..., native=True)
+    _native = False
+    _cache = None
+
     def __init__(self, data, typecode, size, shape, dimensions, attributes=None):
         self.data = data
         self._typecode = typecode
@@ -821,7 +1122,7 @@ class netcdf_variable(object):
         `netcdf_variable`.
 
         """
-        return bool(self.data.shape) and not self._shape[0]
+        return bool(self._shape) and not self._shape[0]
     isrec = property(isrec)
 
     def shape(self):
@@ -830,6 +1131,9 @@ class netcdf_variable(object):
         This is a read-only attribute and can not be modified in the
         same manner of other numpy arrays.
         """
+        if self.data is None:
+            # header only
+            return (self._recs,) + self._shape[1:] if self.isrec else self._shape
         return self.data.shape
     shape = property(shape)
 
@@ -898,7 +1202,27 @@ class netcdf_variable(object):
         return self._size
 
     def __getitem__(self, index):
-        return self.data[index]
+        if self.data is None:
+            raise RuntimeError("variable data is not in memory "
+                               "(header_only or appending records)")
+        if not self._native:
+            return self.data[index]
+
+        key = None
+        if self._cache is not None:
+            key = _indexkey(index)
+            if key is not None:
+                key = (id(self), key)
+                res = self._cache.get(key)
+                if res is not None:
+                    return res
+        data = self.data[index]
+        # swap (and copy) once; single-byte types are returned as views
+        res = data.astype(data.dtype.newbyteorder('='), copy=False)
+        if key is not None and isinstance(res, ndarray):
+            res.flags.writeable = False
+            self._cache.set(key, res)
+        return res
 
     def __setitem__(self, index, data):
         # Expand data for record vars?
@@ -917,5 +1241,25 @@ class netcdf_variable(object):
         self.data[index] = data
 
 
+def _indexkey(index):
+    """ hashable key for a basic index (integers, slices, Ellipsis, None),
+        None for other indices """
+    if not isinstance(index, tuple):
+        index = (index,)
+    key = []
+    for i in index:
+        if isinstance(i, slice):
+            key.append(('slice', i.start, i.stop, i.step))
+        elif i is Ellipsis or i is None:
+            key.append(i)
+        elif (isinstance(i, integer_types + (np.integer,))
+                and not isinstance(i, bool)):
+            key.append(int(i))
+        else:
+            return None
+    return tuple(key)
+
+
 NetCDFFile = netcdf_file
 NetCDFVariable = netcdf_variable
+
@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+"""Benchmark the equation of state kernels in MITgcmutils.density.
+
+Times jmd95 evaluated as one array expression (as before the blocked Horner
+kernels; it creates a dozen full-size temporaries) against the blocked
+kernels of jmd95, unesco, mdjwf and teos10, and reports the peak memory
+allocated by each call in units of the size of one input field, e.g.,
+
+    python bench_density.py 4000000
+
+The number of points defaults to 2**22.  The kernels need no full-size
+temporaries, so their peak memory is that of the result.  Finally, each
+kernel is timed with dtype=np.float32 on float32 input, and the largest
+difference to the float64 result over the oceanographic range is printed
+and checked against the bounds stated in the density module docstring.
+The next table compares rho_alpha_beta with centred finite differences
+(five calls of the equation of state).  The last one compares poly3 with
+a loop over levels (as before the vectorized poly3) for a 3-d field and a
+time series of 3-d fields.
+"""
+import sys
+import time
+import tracemalloc
+import numpy as np
+from MITgcmutils import density
+from MITgcmutils.density import eosJMDCFw, eosJMDCSw, eosJMDCKFw, eosJMDCKSw, eosJMDCKP
+
+
+# bounds of the float32 error [kg/m^3] stated in the density docstring
+float32err = {'jmd95': 3e-4, 'unesco': 3e-4, 'mdjwf': 5e-4, 'teos10': 1e-3}
+
+
+def jmd95_expr(s, t, p):
+    """ jmd95 as a single array expression """
+    p = .1*p
+    t2 = t*t
+    t3 = t2*t
+    t4 = t3*t
+    s3o2 = s*np.sqrt(s)
+    rho = (eosJMDCFw[0] + eosJMDCFw[1]*t + eosJMDCFw[2]*t2
+           + eosJMDCFw[3]*t3 + eosJMDCFw[4]*t4 + eosJMDCFw[5]*t4*t
+           + s*(eosJMDCSw[0] + eosJMDCSw[1]*t + eosJMDCSw[2]*t2
+                + eosJMDCSw[3]*t3 + eosJMDCSw[4]*t4)
+           + s3o2*(eosJMDCSw[5] + eosJMDCSw[6]*t + eosJMDCSw[7]*t2)
+           + eosJMDCSw[8]*s*s)
+    bulkmod = (eosJMDCKFw[0] + eosJMDCKFw[1]*t + eosJMDCKFw[2]*t2
+               + eosJMDCKFw[3]*t3 + eosJMDCKFw[4]*t4
+               + s*(eosJMDCKSw[0] + eosJMDCKSw[1]*t + eosJMDCKSw[2]*t2
+                    + eosJMDCKSw[3]*t3)
+               + s3o2*(eosJMDCKSw[4] + eosJMDCKSw[5]*t + eosJMDCKSw[6]*t2)
+               + p*(eosJMDCKP[0] + eosJMDCKP[1]*t + eosJMDCKP[2]*t2
+                    + eosJMDCKP[3]*t3)
+               + p*s*(eosJMDCKP[4] + eosJMDCKP[5]*t + eosJMDCKP[6]*t2)
+               + p*s3o2*eosJMDCKP[7]
+               + p*p*(eosJMDCKP[8] + eosJMDCKP[9]*t + eosJMDCKP[10]*t2)
+               + p*p*s*(eosJMDCKP[11] + eosJMDCKP[12]*t + eosJMDCKP[13]*t2))
+    return rho/(1. - p/bulkmod)
+
+
+def poly3_loop(poly3, s, t):
+    """ poly3 with a loop over the levels (first axis) """
+    rho = np.empty(s.shape)
+    for k in range(poly3.shape[0]):
+        tRef,sRef,dRef = poly3[k,:3]
+        c = poly3[k,3:]
+        tp = t[k] - tRef
+        sp = s[k] - sRef
+        tp2 = tp*tp
+        sp2 = sp*sp
+        rho[k] = (c[0]*tp + c[1]*sp + c[2]*tp2 + c[3]*tp*sp + c[4]*sp2
+                  + c[5]*tp2*tp + c[6]*tp2*sp + c[7]*tp*sp2 + c[8]*sp2*sp
+                  + dRef + 1000)
+    return rho
+
+
+def timeit(func, repeat=3):
+    best = np.inf
+    for i in range(repeat):
+        t0 = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def peakmem(func):
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def main(n=2**22):
+    n = int(n)
+    rng = np.random.default_rng(1)
+    s = rng.uniform(30., 40., n)
+    t = rng.uniform(-2., 30., n)
+    p = rng.uniform(0., 6000., n)
+    out = np.empty(n)
+    print('{:>16s} {:>9s} {:>8s}'.format('', 'time', 'memory'))
+    for label,func in [('jmd95 expression', lambda: jmd95_expr(s, t, p)),
+                       ('jmd95', lambda: density.jmd95(s, t, p)),
+                       ('jmd95 out=', lambda: density.jmd95(s, t, p, out=out)),
+                       ('unesco', lambda: density.unesco(s, t, p)),
+                       ('mdjwf', lambda: density.mdjwf(s, t, p)),
+                       ('teos10', lambda: density.teos10(s, t, p))]:
+        print('{:>16s} {:8.3f}s {:7.1f}x'.format(label, timeit(func),
+                                               peakmem(func)/s.nbytes))
+
+    s = rng.uniform(0., 42., n).astype(np.float32)
+    t = rng.uniform(-2., 40., n).astype(np.float32)
+    p = rng.uniform(0., 10000., n).astype(np.float32)
+    print('{:>16s} {:>9s} {:>9s} {:>8s}'.format('', 'float64', 'float32', 'error'))
+    for name in ['jmd95', 'unesco', 'mdjwf', 'teos10']:
+        func = getattr(density, name)
+        err = np.abs(func(s, t, p, dtype=np.float32) - func(s, t, p)).max()
+        print('{:>16s} {:8.3f}s {:8.3f}s {:8.1e}'.format(
+              name, timeit(lambda: func(s, t, p)),
+              timeit(lambda: func(s, t, p, dtype=np.float32)), err))
+        assert err < float32err[name], (
+            '{} float32 error {:.1e} exceeds {:.0e}'.format(
+                name, err, float32err[name]))
+
+    def finitediff(func, h=1.e-3):
+        rho = func(s, t, p)
+        return (rho, (func(s, t - h, p) - func(s, t + h, p))/(2*h*rho),
+                (func(s + h, t, p) - func(s - h, t, p))/(2*h*rho))
+
+    s = rng.uniform(1., 42., n)
+    t = rng.uniform(-2., 40., n)
+    p = rng.uniform(0., 10000., n)
+    print('{:>16s} {:>9s} {:>9s}'.format('', 'analytic', 'fin.diff.'))
+    for name in ['jmd95', 'unesco', 'mdjwf', 'teos10']:
+        func = getattr(density, name)
+        print('{:>16s} {:8.3f}s {:8.3f}s'.format(
+              name, timeit(lambda: density.rho_alpha_beta(name, s, t, p)),
+              timeit(lambda: finitediff(func))))
+
+    nr = 50
+    coeffs = np.c_[rng.uniform(0., 20., nr), rng.uniform(33., 36., nr),
+                   rng.uniform(20., 30., nr), rng.normal(0., .1, (nr, 9))]
+    ny = max(1, int(np.sqrt(n/nr)))
+    print('{:>16s} {:>9s} {:>9s}'.format('', 'loop', 'vector'))
+    for nt in [None, 4]:
+        shape = (nr, ny, ny) if nt is None else (nt, nr, ny, ny)
+        s = rng.uniform(30., 40., shape)
+        t = rng.uniform(-2., 30., shape)
+        if nt is None:
+            loop = lambda: poly3_loop(coeffs, s, t)
+        else:
+            loop = lambda: [ poly3_loop(coeffs, s[i], t[i]) for i in range(nt) ]
+        print('{:>16s} {:8.3f}s {:8.3f}s'.format(
+              'x'.join(str(i) for i in shape), timeit(loop),
+              timeit(lambda: density.poly3(coeffs, s, t, zaxis=-3))))
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:2])
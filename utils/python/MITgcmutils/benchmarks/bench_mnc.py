@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+"""Benchmark parallel tile assembly in MNCVariable.
+
+Writes a synthetic mnc data set (a few records of a 3-d field, one file per
+tile) with an increasing number of tiles and times reading the whole field
+and a section with different numbers of worker threads, e.g.,
+
+    python bench_mnc.py /scratch/$USER/mncbench
+
+Threads only help with several cores and tiles large enough for the
+byte swapping and copying to outweigh the per-tile Python overhead.
+"""
+import os
+import sys
+import time
+import shutil
+import tempfile
+import numpy as np
+from MITgcmutils.mnc import MNC
+from MITgcmutils.netcdf import netcdf_file
+
+def write_tiles(dirname, ntx, nty, sNx=30, sNy=30, nr=10, nt=4):
+    """ write ntx*nty tiles of a (nt, nr, nty*sNy, ntx*sNx) field """
+    fld = np.ones((nt, nr, sNy, sNx), '>f4')
+    for tn in range(1, ntx*nty+1):
+        fname = os.path.join(dirname, 'state.0000000000.t{:03d}.nc'.format(tn))
+        nc = netcdf_file(fname, 'w')
+        nc.sNx = sNx
+        nc.sNy = sNy
+        nc.nSx = 1
+        nc.nSy = 1
+        nc.nPx = ntx
+        nc.nPy = nty
+        nc.Nx = ntx*sNx
+        nc.Ny = nty*sNy
+        nc.tile_number = tn
+        nc.createDimension('T', None)
+        nc.createDimension('Z', nr)
+        nc.createDimension('Y', sNy)
+        nc.createDimension('X', sNx)
+        nc.createVariable('iter', 'i', ('T',))[:] = np.arange(nt)
+        nc.createVariable('Temp', 'f', ('T', 'Z', 'Y', 'X'))[:] = fld
+        nc.close()
+
+
+def timeit(func, repeat=3):
+    best = np.inf
+    for i in range(repeat):
+        t0 = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main(basedir=None, workerlist=(None, 2, 4, 8)):
+    print('{:>6s} {:>8s} '.format('tiles', 'read') +
+          ' '.join('{:>9s}'.format('w=' + str(w or 1)) for w in workerlist))
+    for ntx,nty in [(4, 4), (8, 8), (16, 16), (32, 32)]:
+        dirname = tempfile.mkdtemp(dir=basedir)
+        try:
+            write_tiles(dirname, ntx, nty)
+            fpatt = os.path.join(dirname, 'state.0000000000.t*.nc')
+            for label,ind in [('all', Ellipsis), ('section', np.s_[:, :, 10])]:
+                times = []
+                for w in workerlist:
+                    nc = MNC(fpatt, workers=w)
+                    times.append(timeit(lambda: nc.variables['Temp'][ind]))
+                    nc.close()
+                print('{:6d} {:>8s} '.format(ntx*nty, label) +
+                      ' '.join('{:8.3f}s'.format(t) for t in times))
+        finally:
+            shutil.rmtree(dirname)
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:2])
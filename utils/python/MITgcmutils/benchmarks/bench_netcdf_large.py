@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+"""Write and read back large netcdf files with MITgcmutils.netcdf.
+
+Creates, with write_header, a version 2 (64-bit offset) file with two
+fixed variables of 3 GiB each, so that the variables after them start
+beyond 2**32 bytes, and a version 5 (CDF-5) file with one variable of
+more than 2**32 bytes, each followed by a small variable (the non-record
+variables are written in reverse order of their names) and a record
+variable.  Only a few values at the start and end of each variable are
+written with os.pwrite at the positions given by data_offset, so the
+files stay sparse on file systems that support it.  The files are read
+back with mmap (reading without mmap would need all of the data in
+memory) and the values compared, e.g.,
+
+    python bench_netcdf_large.py /scratch/tmp
+
+The directory defaults to the system temporary directory; the files are
+removed afterwards.
+"""
+import os
+import sys
+import time
+import tempfile
+import numpy as np
+from MITgcmutils.netcdf import netcdf_file
+
+# dimension lengths are limited to 2**31 - 1 in version 2
+shape = {2: (3, 2**30), 5: (2**32 + 8,)}
+nrec = 3
+
+
+def write(fname, version):
+    t0 = time.perf_counter()
+    f = netcdf_file(fname, 'w', version=version)
+    f.createDimension('T', None)
+    f.createDimension('Z', 3)
+    f.createDimension('X', shape[version][-1])
+    f.createDimension('Y', 5)
+    dims = ('X',) if version == 5 else ('Z', 'X')
+    names = ['big', 'big2'] if version == 2 else ['big']
+    for name in names:
+        f.createVariable(name, 'b', dims)
+    f.createVariable('after', 'f8', ('Y',))
+    f.createVariable('rec', 'i4', ('T', 'Y'))
+    f.write_header(nrec)
+    assert f.data_offset('after') > 2**32
+    fd = f.fp.fileno()
+    for i,name in enumerate(names):
+        off = f.data_offset(name)
+        os.pwrite(fd, np.array([1, 2], 'b').tobytes(), off)
+        os.pwrite(fd, np.array([i + 3, i + 4], 'b').tobytes(),
+                  off + np.prod(shape[version]) - 2)
+    os.pwrite(fd, np.arange(5.).astype('>f8').tobytes(),
+              f.data_offset('after'))
+    for r in range(nrec):
+        os.pwrite(fd, (np.arange(5) + 10*r).astype('>i4').tobytes(),
+                  f.data_offset('rec', r))
+    f.close()
+    return names, time.perf_counter() - t0
+
+
+def check(fname, version, names):
+    t0 = time.perf_counter()
+    f = netcdf_file(fname, 'r', mmap=True)
+    assert f.version_byte == version
+    for i,name in enumerate(names):
+        var = f.variables[name]
+        assert var.shape == shape[version], var.shape
+        data = var[:].reshape(-1)
+        assert (data[:2] == [1, 2]).all() and (data[-2:] == [i + 3, i + 4]).all()
+        assert data[data.size//2] == 0
+    assert (f.variables['after'][:] == np.arange(5.)).all()
+    assert (f.variables['rec'][:] == np.arange(5) + 10*np.arange(nrec)[:,None]).all()
+    f.close()
+    return time.perf_counter() - t0
+
+
+def main(dirname=None):
+    print('{:>8s} {:>9s} {:>9s} {:>9s}'.format('', 'size', 'write', 'read'))
+    for version in [2, 5]:
+        fd, fname = tempfile.mkstemp(suffix='.nc', dir=dirname)
+        os.close(fd)
+        try:
+            names, twrite = write(fname, version)
+            tread = check(fname, version, names)
+            print('{:>8s} {:7.2f}GB {:8.3f}s {:8.3f}s'.format(
+                  'v%d' % version, os.path.getsize(fname)/1e9, twrite, tread))
+        finally:
+            os.remove(fname)
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:2])
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+"""Micro-benchmark for parsing mds meta files.
+
+Compares mds.parsemeta (single pass over the whole file) with the
+line-by-line parser it falls back to for unusual files, for a typical
+tile meta file of a diagnostics stream and, if given, for all meta files
+found under a directory:
+
+    python bench_parsemeta.py ../../../../verification
+"""
+import os
+import sys
+import glob
+import timeit
+from MITgcmutils import mds
+
+tilemeta = """ nDims = [   3 ];
+ dimList = [
+  4320,  1081,  1170,
+ 56160,  2161,  2250,
+    90,     1,    90
+ ];
+ dataprec = [ 'float32' ];
+ nrecords = [     4 ];
+ timeStepNumber = [     144000 ];
+ /* modelTime = [  5.184000000000E+06 ];*/
+ timeInterval = [  5.097600000000E+06  5.184000000000E+06 ];
+ missingValue = [ -9.99000000000000E+02 ];
+ nFlds = [    4 ];
+ fldList = {
+ 'THETA   ' 'SALT    ' 'UVELMASS' 'VVELMASS'
+ };
+"""
+
+def bench(texts, number):
+    new = lambda: [ mds._parsemetatext(t, 'bench') for t in texts ]
+    old = lambda: [ mds._parsemetalines(mds._iterlines(t), 'bench') for t in texts ]
+    assert new() == old()
+    tnew = min(timeit.repeat(new, number=number, repeat=5))/number
+    told = min(timeit.repeat(old, number=number, repeat=5))/number
+    return told, tnew
+
+
+def main(topdir=None):
+    cases = [('tile meta file', [tilemeta])]
+    if topdir is not None:
+        texts = []
+        for f in glob.glob(os.path.join(topdir, '**', '*.meta'), recursive=True):
+            with open(f) as fp:
+                texts.append(fp.read())
+        cases.append(('{} meta files'.format(len(texts)), texts))
+    print('{:>20s} {:>12s} {:>12s} {:>8s}'.format('', 'line-by-line', 'one pass', 'speedup'))
+    for name,texts in cases:
+        told,tnew = bench(texts, max(1, 2000//len(texts)))
+        print('{:>20s} {:10.1f}us {:10.1f}us {:7.1f}x'.format(
+              name, 1e6*told, 1e6*tnew, told/tnew))
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:2])
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+"""Benchmark concurrent tile reading in rdmds.
+
+Writes a synthetic tiled mds data set (one iteration of a 3-d field) with
+an increasing number of tiles and times rdmds with different numbers of
+worker threads.  Run this on the file system you want to tune for, e.g.,
+
+    python bench_rdmds.py /scratch/$USER/mdsbench
+
+Gains are small on a local disk with a warm page cache; they come from
+overlapping the per-file latency of parallel file systems.
+"""
+import os
+import sys
+import time
+import shutil
+import tempfile
+import numpy as np
+from MITgcmutils import mds
+
+def write_tiles(dirname, ntx, nty, sNx=30, sNy=30, nr=10):
+    """ write ntx*nty tiles of a (nr, nty*sNy, ntx*sNx) field """
+    nx = ntx*sNx
+    ny = nty*sNy
+    fld = np.ones((nr, sNy, sNx), '>f4')
+    for bj in range(nty):
+        for bi in range(ntx):
+            fbase = os.path.join(dirname, 'T.0000000000.{:03d}.{:03d}'.format(bi+1, bj+1))
+            with open(fbase + '.meta', 'w') as f:
+                f.write(" nDims = [   3 ];\n")
+                f.write(" dimList = [\n"
+                        " {:5d},{:5d},{:5d},\n"
+                        " {:5d},{:5d},{:5d},\n"
+                        " {:5d},{:5d},{:5d}\n"
+                        " ];\n".format(nx, bi*sNx+1, (bi+1)*sNx,
+                                       ny, bj*sNy+1, (bj+1)*sNy,
+                                       nr, 1, nr))
+                f.write(" dataprec = [ 'float32' ];\n")
+                f.write(" nrecords = [     1 ];\n")
+                f.write(" timeStepNumber = [          0 ];\n")
+            fld.tofile(fbase + '.data')
+
+
+def timeit(func, repeat=3):
+    best = np.inf
+    for i in range(repeat):
+        t0 = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main(basedir=None, workerlist=(None, 2, 4, 8, 16)):
+    print('{:>6s} '.format('tiles') +
+          ' '.join('{:>9s}'.format('w=' + str(w or 1)) for w in workerlist))
+    for ntx,nty in [(4, 4), (8, 8), (16, 16), (32, 32)]:
+        dirname = tempfile.mkdtemp(dir=basedir)
+        try:
+            write_tiles(dirname, ntx, nty)
+            fname = os.path.join(dirname, 'T')
+            times = [ timeit(lambda: mds.rdmds(fname, 0, workers=w))
+                      for w in workerlist ]
+        finally:
+            shutil.rmtree(dirname)
+        print('{:6d} '.format(ntx*nty) +
+              ' '.join('{:8.3f}s'.format(t) for t in times))
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:2])
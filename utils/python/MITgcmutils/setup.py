@@ -13,7 +13,7 @@ setuptools.setup(
     long_description_content_type="text/markdown",
     url="http://mitgcm.org/",
     packages=setuptools.find_packages(),
-    scripts=["scripts/gluemncbig"],
+    scripts=["scripts/gluemncbig", "scripts/mdsindex"],
     classifiers=[
         "Programming Language :: Python",
         "License :: OSI Approved :: MIT License",